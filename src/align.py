@@ -6,6 +6,19 @@ import cv2
 import numpy as np
 
 from .detect import FaceBox
+from .telemetry import timed
+
+# ArcFace reference landmarks for a 112x112 crop (InsightFace template).
+ARCFACE_DST = np.array(
+    [
+        [38.2946, 51.6963],
+        [73.5318, 51.5014],
+        [56.0252, 71.7366],
+        [41.5493, 92.3655],
+        [70.7299, 92.2041],
+    ],
+    dtype=np.float32,
+)
 
 
 def crop_and_resize(image_bgr: np.ndarray, box: FaceBox, size: Tuple[int, int] = (112, 112)) -> np.ndarray:
@@ -18,3 +31,54 @@ def crop_and_resize(image_bgr: np.ndarray, box: FaceBox, size: Tuple[int, int] =
     if face.size == 0:
         return np.zeros((size[1], size[0], 3), dtype=np.uint8)
     return cv2.resize(face, size, interpolation=cv2.INTER_LINEAR)
+
+
+def gray_stack(stack_bgr: np.ndarray) -> np.ndarray:
+    """Grayscale of a (..., H, W, 3) uint8 stack with a single ``cvtColor`` call."""
+    stack_bgr = np.ascontiguousarray(stack_bgr)
+    lead = stack_bgr.shape[:-3]
+    h, w = stack_bgr.shape[-3:-1]
+    gray = cv2.cvtColor(stack_bgr.reshape(-1, w, 3), cv2.COLOR_BGR2GRAY)
+    return gray.reshape(lead + (h, w))
+
+
+def estimate_similarity(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Least-squares similarity transform (Umeyama) mapping src points to dst.
+
+    Returns the 2x3 affine matrix expected by ``cv2.warpAffine``.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=0)
+    dst_mean = dst.mean(axis=0)
+    src_d = src - src_mean
+    dst_d = dst - dst_mean
+
+    cov = dst_d.T @ src_d / src.shape[0]
+    d = np.ones(2)
+    if np.linalg.det(cov) < 0:
+        d[1] = -1.0
+    u, s, vt = np.linalg.svd(cov)
+    rot = u @ np.diag(d) @ vt
+
+    src_var = src_d.var(axis=0).sum()
+    scale = float(s @ d) / max(src_var, 1e-12)
+    t = dst_mean - scale * rot @ src_mean
+
+    m = np.empty((2, 3), dtype=np.float64)
+    m[:, :2] = scale * rot
+    m[:, 2] = t
+    return m
+
+
+@timed("align")
+def align_face(image_bgr: np.ndarray, box: FaceBox, size: Tuple[int, int] = (112, 112)) -> np.ndarray:
+    """Warp the face onto the ArcFace landmark template.
+
+    Falls back to ``crop_and_resize`` when the detector gave no landmarks.
+    """
+    if box.landmarks is None:
+        return crop_and_resize(image_bgr, box, size)
+    dst = ARCFACE_DST * np.array([size[0] / 112.0, size[1] / 112.0], dtype=np.float32)
+    m = estimate_similarity(box.landmarks, dst)
+    return cv2.warpAffine(image_bgr, m, size, borderValue=0.0)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from .align import align_face
+from .detect import FaceBox, detector_from_config
+from .embed import FaceEmbedder
+from .models import configure_runtime
+from .pipeline import (
+    VerificationError,
+    decode_image,
+    image_pad,
+    load_config,
+    locate_face,
+    match_result,
+    pad_result,
+    print_result,
+    reference_quality,
+    verify_video,
+)
+from .quality import quality_settings
+from .telemetry import request
+
+# Selfie and reference are independent until the final cosine, so they run as
+# separate branches: decode -> detect -> align -> embed each, with PAD on the
+# selfie crop overlapping both embeddings. OpenCV, NumPy and ONNX Runtime
+# release the GIL, so threads give real parallelism. Decode/PAD run on a CPU
+# pool and detector/ArcFace calls on a smaller model pool, both bounded so
+# concurrent verifications cannot oversubscribe the cores.
+
+ImageInput = str | Path | bytes | np.ndarray
+
+
+class AsyncVerifier:
+    """asyncio front end over the same detect/embed/PAD code as ``pipeline``."""
+
+    def __init__(self, detector, embedder, config: dict, cpu_workers: int = 4, model_workers: int = 2):
+        self.detector = detector
+        self.embedder = embedder
+        self.config = config
+        self._cpu = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="kyc-cpu")
+        self._model = ThreadPoolExecutor(max_workers=model_workers, thread_name_prefix="kyc-model")
+
+    async def _on(self, pool: ThreadPoolExecutor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    def _detect(self, image: np.ndarray) -> List[FaceBox]:
+        # Called from a CPU-pool thread; the model pool never waits on the CPU pool.
+        return self._model.submit(self.detector.detect_faces, image).result()
+
+    async def _face(self, source: ImageInput, what: str, missing: str, settings: dict | None) -> Tuple[np.ndarray, FaceBox]:
+        decoded = await self._on(self._cpu, decode_image, self.config, source)
+        if decoded.image is None:
+            raise VerificationError(f"Failed to read {what}")
+        # Quality checks and the full-resolution fallback run on the CPU pool, detection on the model pool.
+        return await self._on(self._cpu, locate_face, self._detect, decoded, settings, what, missing)
+
+    async def _embedding(self, image: np.ndarray, face: FaceBox) -> np.ndarray:
+        aligned = await self._on(self._cpu, align_face, image, face)
+        return (await self._on(self._model, self.embedder.embed_batch, [aligned]))[0]
+
+    async def _reference_embedding(self, source: ImageInput) -> np.ndarray:
+        image, face = await self._face(source, "reference", "No face in reference", reference_quality(self.config))
+        return await self._embedding(image, face)
+
+    async def verify_image(self, image: ImageInput, reference: ImageInput | None = None) -> dict:
+        """Same result as ``pipeline.verify_image``; inputs may be paths, encoded bytes or arrays."""
+        with request("image"):
+            tasks = []
+            try:
+                ref_task = None
+                if reference is not None:
+                    # Starts right away; runs alongside the whole selfie branch.
+                    ref_task = asyncio.ensure_future(self._reference_embedding(reference))
+                    tasks.append(ref_task)
+                selfie, face = await self._face(image, "image", "No face detected", quality_settings(self.config))
+                pad_task = asyncio.ensure_future(self._on(self._cpu, image_pad, self.config, selfie, face))
+                tasks.append(pad_task)
+                if ref_task is None:
+                    return pad_result(await pad_task)
+                selfie_task = asyncio.ensure_future(self._embedding(selfie, face))
+                tasks.append(selfie_task)
+                decision, selfie_emb, ref_emb = await asyncio.gather(pad_task, selfie_task, ref_task)
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+                # Retrieves every branch's outcome, so a branch that failed while
+                # another raised is not reported as "exception never retrieved".
+                await asyncio.gather(*tasks, return_exceptions=True)
+            result = pad_result(decision)
+            result.update(match_result(self.config, selfie_emb, ref_emb))
+        return result
+
+    async def verify_video(self, video_path: str | Path) -> dict:
+        return await self._on(self._cpu, verify_video, self.detector, self.config, video_path)
+
+    def close(self) -> None:
+        self._cpu.shutdown(wait=True)
+        self._model.shutdown(wait=True)
+
+
+async def _run(args: argparse.Namespace) -> int:
+    config = load_config(Path(args.config))
+    configure_runtime(config.get("runtime"))
+    detector = detector_from_config(config)
+    embedder = FaceEmbedder(batch_size=config["recognition"].get("batch_size", 64)) if args.reference else None
+    verifier = AsyncVerifier(detector, embedder, config, args.cpu_workers, args.model_workers)
+    try:
+        if args.image:
+            result = await verifier.verify_image(args.image, args.reference)
+        else:
+            result = await verifier.verify_video(args.video)
+    except VerificationError as exc:
+        print(exc)
+        return 1
+    finally:
+        verifier.close()
+    print_result(result)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="KYC pipeline with selfie/reference branches run concurrently")
+    parser.add_argument("--image", type=str, help="Input selfie image path")
+    parser.add_argument("--video", type=str, help="Input selfie video path")
+    parser.add_argument("--reference", type=str, help="Reference ID face image path")
+    parser.add_argument("--config", type=str, default="configs/thresholds.yaml")
+    parser.add_argument("--cpu-workers", type=int, default=4, help="Threads for decode/align/PAD")
+    parser.add_argument("--model-workers", type=int, default=2, help="Threads for detector/ArcFace calls")
+    args = parser.parse_args()
+
+    if not args.image and not args.video:
+        print("Provide --image or --video")
+        return 1
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
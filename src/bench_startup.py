@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Sequence
+
+# Cold-start cost of each CLI entry point, measured in fresh interpreters the
+# way batch schedulers launch them. The "eager" column imports insightface and
+# onnxruntime up front, as the modules did before model loading was made lazy,
+# so the difference is the saving per short-lived process that never builds a
+# RetinaFace/ArcFace session.
+
+# Entry points that reach src.models (and so used to import insightface).
+ENTRY_POINTS = (
+    "src.pipeline",
+    "src.async_pipeline",
+    "src.service",
+    "src.eval_pad",
+    "src.eval_metrics",
+    "src.download_models",
+)
+EAGER_IMPORTS = ("insightface", "onnxruntime")
+HEAVY_MODULES = ("insightface", "onnxruntime", "skimage", "scipy", "matplotlib", "albumentations")
+
+_PROBE = """
+import json, sys
+{prelude}
+import {module}
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+"""
+
+
+def time_import(module: str, eager: bool = False, repeat: int = 5) -> tuple[float, List[str]]:
+    """Median wall time (s) of ``python -c 'import module'`` and the heavy modules it loaded."""
+    prelude = "\n".join(f"import {name}" for name in EAGER_IMPORTS) if eager else ""
+    code = _PROBE.format(prelude=prelude, module=module, heavy=HEAVY_MODULES)
+    times = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        loaded = json.loads(out.stdout.strip().splitlines()[-1])
+    return statistics.median(times), loaded
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of each entry point (lazy vs eager model imports)")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS), help="Modules to time (default: all entry points)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement (median is reported)")
+    args = parser.parse_args(argv)
+
+    baseline, _ = time_import("sys", repeat=args.repeat)
+    print(f"Interpreter start: {baseline * 1000:.0f} ms")
+    print(f"{'entry point':<22}{'lazy ms':>9}{'eager ms':>10}{'saved ms':>10}  heavy modules loaded")
+    for module in args.modules:
+        lazy, loaded = time_import(module, repeat=args.repeat)
+        eager, _ = time_import(module, eager=True, repeat=args.repeat)
+        print(f"{module:<22}{lazy * 1000:>9.0f}{eager * 1000:>10.0f}{(eager - lazy) * 1000:>10.0f}  {', '.join(loaded) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from typing import Dict, Iterator, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import curve_rates_at, curve_from_histograms, equal_error_rate, error_curve, fnr_at_fpr, fpr_at_fnr
+
+# Bootstrap confidence intervals on the metrics of ``metrics.py``. Scores are
+# bucketed once on a fixed threshold grid; every resample is then just a
+# vector of per-bucket label counts, so a chunk of resamples is a 2-D array and
+# all curves, operating points and EERs are computed with array ops. The grid
+# is subsampled in the bulk of the distribution but keeps every operating
+# threshold of the point estimates and every score in the low-FPR / low-FNR
+# tails, so tail operating points are resolved as finely as the estimate.
+
+
+MIN_DENSE_POINTS = 256
+TAIL_RATE = 1e-2  # full grid resolution beyond this FPR (impostors) / FNR (genuines)
+
+
+@dataclass
+class Interval:
+    estimate: float
+    low: float
+    high: float
+
+
+def _grid(scores: np.ndarray, anchors: Sequence[float], max_points: int, tails: Sequence[np.ndarray] = ()) -> np.ndarray:
+    """Distinct scores (subsampled to ``max_points``) plus ``anchors`` and every score in ``tails``."""
+    distinct = np.unique(scores)
+    if len(distinct) > max_points:
+        distinct = distinct[np.linspace(0, len(distinct) - 1, max_points).astype(np.int64)]
+    return np.unique(np.concatenate([distinct, np.asarray(anchors, dtype=np.float64), *tails]))
+
+
+def _chunks(n_resamples: int, cells_per_resample: int, max_bytes: int) -> Iterator[int]:
+    # Roughly four float64 (chunk, cells) arrays are alive at once.
+    size = max(1, min(n_resamples, max_bytes // max(cells_per_resample * 8 * 4, 1)))
+    done = 0
+    while done < n_resamples:
+        step = min(size, n_resamples - done)
+        yield step
+        done += step
+
+
+def _iid_counts(pos: np.ndarray, neg: np.ndarray, size: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """Resampling n items with replacement == one multinomial draw over buckets."""
+    n_pos, n_neg = pos.sum(), neg.sum()
+    pos_draws = rng.multinomial(n_pos, pos / max(n_pos, 1), size=size) if n_pos else np.zeros((size, len(pos)), np.int64)
+    neg_draws = rng.multinomial(n_neg, neg / max(n_neg, 1), size=size) if n_neg else np.zeros((size, len(neg)), np.int64)
+    return pos_draws, neg_draws
+
+
+def _group_tables(
+    buckets: np.ndarray, is_pos: np.ndarray, group_idx: np.ndarray, n_groups: int, n_buckets: int, max_bytes: int
+):
+    """Per-subject bucket counts: dense (S, K) matrices when they fit, else None."""
+    if n_groups * n_buckets * 4 * 2 > max_bytes:
+        return None
+    flat = group_idx * n_buckets + buckets
+    size = n_groups * n_buckets
+    pos = np.bincount(flat[is_pos], minlength=size).reshape(n_groups, n_buckets).astype(np.float32)
+    neg = np.bincount(flat[~is_pos], minlength=size).reshape(n_groups, n_buckets).astype(np.float32)
+    return pos, neg
+
+
+def _group_counts(
+    buckets: np.ndarray,
+    is_pos: np.ndarray,
+    group_idx: np.ndarray,
+    n_groups: int,
+    n_buckets: int,
+    tables,
+    size: int,
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Resample whole subjects; every score inherits its subject's draw count."""
+    draws = rng.multinomial(n_groups, np.full(n_groups, 1.0 / n_groups), size=size)
+    if tables is not None:
+        weights = draws.astype(np.float32)
+        return weights @ tables[0], weights @ tables[1]
+
+    weights = draws[:, group_idx]
+    offsets = (np.arange(size) * n_buckets)[:, None]
+    flat = (buckets[None, :] + offsets).ravel()
+    pos_w = (weights * is_pos[None, :]).ravel()
+    neg_w = (weights * ~is_pos[None, :]).ravel()
+    pos = np.bincount(flat, weights=pos_w, minlength=size * n_buckets).reshape(size, n_buckets)
+    neg = np.bincount(flat, weights=neg_w, minlength=size * n_buckets).reshape(size, n_buckets)
+    return pos, neg
+
+
+def _resample_stats(
+    pos: np.ndarray, neg: np.ndarray, k_thr: int, fpr_targets: Sequence[float], fnr_targets: Sequence[float]
+) -> Dict[str, np.ndarray]:
+    """Per-resample metrics from (chunk, K) bucket counts."""
+    zeros = np.zeros((pos.shape[0], 1))
+    cum_pos = np.concatenate([zeros, np.cumsum(pos, axis=1)], axis=1)
+    cum_neg = np.concatenate([zeros, np.cumsum(neg, axis=1)], axis=1)
+    n_pos = np.maximum(cum_pos[:, -1:], 1)
+    n_neg = cum_neg[:, -1:]
+    fnr = cum_pos / n_pos
+    fpr = (n_neg - cum_neg) / np.maximum(n_neg, 1)
+
+    rows = np.arange(pos.shape[0])
+    k_eer = np.argmin(np.abs(fpr - fnr), axis=1)
+    out = {
+        "fpr": fpr[:, k_thr],
+        "fnr": fnr[:, k_thr],
+        "eer": (fpr[rows, k_eer] + fnr[rows, k_eer]) / 2.0,
+    }
+    for target in fpr_targets:
+        k = np.argmax(fpr <= target, axis=1)
+        out[f"fnr@fpr={target:g}"] = fnr[rows, k]
+    for target in fnr_targets:
+        k = fnr.shape[1] - 1 - np.argmax((fnr <= target)[:, ::-1], axis=1)
+        out[f"fpr@fnr={target:g}"] = fpr[rows, k]
+    return out
+
+
+def _point_estimates(
+    curve, threshold: float, fpr_targets: Sequence[float], fnr_targets: Sequence[float]
+) -> Tuple[Dict[str, float], list]:
+    """Metric estimates and the curve thresholds they were read at."""
+    fpr, fnr = curve_rates_at(curve, threshold)
+    eer, eer_thr = equal_error_rate(curve)
+    est = {"fpr": fpr, "fnr": fnr, "eer": eer}
+    anchors = [threshold, eer_thr]
+    for target in fpr_targets:
+        est[f"fnr@fpr={target:g}"], thr = fnr_at_fpr(curve, target)
+        anchors.append(thr)
+    for target in fnr_targets:
+        est[f"fpr@fnr={target:g}"], thr = fpr_at_fnr(curve, target)
+        anchors.append(thr)
+    return est, anchors
+
+
+def _intervals(est: Dict[str, float], samples: Dict[str, list], confidence: float) -> Dict[str, Interval]:
+    alpha = (1.0 - confidence) / 2.0
+    result = {}
+    for name, value in est.items():
+        values = np.concatenate(samples[name])
+        low, high = np.quantile(values, [alpha, 1.0 - alpha])
+        result[name] = Interval(estimate=float(value), low=float(low), high=float(high))
+    return result
+
+
+def bootstrap_intervals(
+    scores: Sequence[float],
+    labels: Sequence[int],
+    threshold: float,
+    n_resamples: int = 1000,
+    groups: Sequence | None = None,
+    fpr_targets: Sequence[float] = (),
+    fnr_targets: Sequence[float] = (),
+    confidence: float = 0.95,
+    max_points: int = 4096,
+    max_bytes: int = 256 << 20,
+    seed: int = 0,
+) -> Dict[str, Interval]:
+    """Percentile bootstrap CIs for fpr/fnr at ``threshold``, EER and target points.
+
+    Keys follow ``metrics.py`` naming: ``fpr`` (FAR/BPCER), ``fnr`` (FRR/APCER),
+    ``eer``, ``fnr@fpr=<t>`` and ``fpr@fnr=<t>``. With ``groups`` (one subject id
+    per score) whole subjects are resampled instead of individual scores.
+    Resamples are evaluated on about ``max_points`` quantile-spaced
+    thresholds plus the estimates' own thresholds and, for targets, every
+    impostor score above the FPR=``TAIL_RATE`` threshold (every genuine
+    score below the FNR=``TAIL_RATE`` one).
+    """
+    s = np.asarray(scores, dtype=np.float64).ravel()
+    is_pos = np.asarray(labels).ravel() == 1
+    curve = error_curve(s, is_pos.astype(np.int8))
+    est, anchors = _point_estimates(curve, threshold, fpr_targets, fnr_targets)
+    tails = []
+    if fpr_targets:
+        tails.append(s[~is_pos & (s >= fnr_at_fpr(curve, TAIL_RATE)[1])])
+    if fnr_targets:
+        tails.append(s[is_pos & (s <= fpr_at_fnr(curve, TAIL_RATE)[1])])
+
+    if groups is not None:
+        _, group_idx = np.unique(np.asarray(groups), return_inverse=True)
+        group_idx = group_idx.ravel()
+        n_groups = int(group_idx.max()) + 1
+        # Prefer a coarser grid that lets subject resamples run as one matmul.
+        dense_points = (max_bytes // 2) // (n_groups * 4 * 2) - 1
+        if dense_points >= MIN_DENSE_POINTS:
+            max_points = min(max_points, dense_points)
+
+    grid = _grid(s, anchors, max_points, tails)
+    buckets = np.searchsorted(grid, s, side="right") - 1
+    k_thr = int(np.searchsorted(grid, threshold))
+    n_buckets = len(grid)
+    rng = np.random.default_rng(seed)
+    samples: Dict[str, list] = {name: [] for name in est}
+
+    if groups is None:
+        pos = np.bincount(buckets[is_pos], minlength=n_buckets)
+        neg = np.bincount(buckets[~is_pos], minlength=n_buckets)
+        cells = n_buckets
+    else:
+        tables = _group_tables(buckets, is_pos, group_idx, n_groups, n_buckets, max_bytes // 2)
+        cells = max(n_buckets, n_groups) if tables is not None else max(n_buckets, len(s))
+
+    for size in _chunks(n_resamples, cells, max_bytes):
+        if groups is None:
+            pos_draws, neg_draws = _iid_counts(pos, neg, size, rng)
+        else:
+            pos_draws, neg_draws = _group_counts(buckets, is_pos, group_idx, n_groups, n_buckets, tables, size, rng)
+        for name, values in _resample_stats(pos_draws, neg_draws, k_thr, fpr_targets, fnr_targets).items():
+            samples[name].append(values)
+
+    return _intervals(est, samples, confidence)
+
+
+def bootstrap_histogram_intervals(
+    pos_counts: np.ndarray,
+    neg_counts: np.ndarray,
+    edges: np.ndarray,
+    threshold: float,
+    n_resamples: int = 1000,
+    fpr_targets: Sequence[float] = (),
+    fnr_targets: Sequence[float] = (),
+    confidence: float = 0.95,
+    max_bytes: int = 256 << 20,
+    seed: int = 0,
+) -> Dict[str, Interval]:
+    """Same as ``bootstrap_intervals`` for histogram counts (iid resampling only)."""
+    pos_counts = np.asarray(pos_counts, dtype=np.int64)
+    neg_counts = np.asarray(neg_counts, dtype=np.int64)
+    curve = curve_from_histograms(pos_counts, neg_counts, edges)
+    est, _ = _point_estimates(curve, threshold, fpr_targets, fnr_targets)
+
+    k_thr = min(int(np.searchsorted(curve.thresholds, threshold)), len(curve.thresholds) - 1)
+    rng = np.random.default_rng(seed)
+    samples: Dict[str, list] = {name: [] for name in est}
+    for size in _chunks(n_resamples, len(pos_counts), max_bytes):
+        pos_draws, neg_draws = _iid_counts(pos_counts, neg_counts, size, rng)
+        for name, values in _resample_stats(pos_draws, neg_draws, k_thr, fpr_targets, fnr_targets).items():
+            samples[name].append(values)
+    return _intervals(est, samples, confidence)
+
+
+def format_interval(interval: Interval | None) -> str:
+    if interval is None:
+        return ""
+    return f" [{interval.low:.4f}, {interval.high:.4f}]"
+
+
+def _self_check(n_pos: int, n_neg: int, n_resamples: int, seed: int) -> int:
+    """Every point estimate must lie inside its own interval (iid and subject resampling)."""
+    rng = np.random.default_rng(seed)
+    scores = np.concatenate([rng.normal(0.6, 0.12, n_pos), rng.normal(0.1, 0.1, n_neg)])
+    labels = np.concatenate([np.ones(n_pos, np.int8), np.zeros(n_neg, np.int8)])
+    subjects = rng.integers(0, max(1, (n_pos + n_neg) // 50), n_pos + n_neg)
+    failures = 0
+    for mode, groups in (("iid", None), ("subject", subjects)):
+        intervals = bootstrap_intervals(
+            scores, labels, 0.4, n_resamples=n_resamples, groups=groups,
+            fpr_targets=(1e-2, 1e-3, 1e-4), fnr_targets=(1e-2, 5e-2), seed=seed,
+        )
+        for name, ci in intervals.items():
+            ok = ci.low <= ci.estimate <= ci.high
+            failures += not ok
+            print(f"{mode:<8}{name:<16}{ci.estimate:.5f}{format_interval(ci)}  {'ok' if ok else 'OUTSIDE'}")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check that bootstrap intervals contain their point estimates")
+    parser.add_argument("--genuine", type=int, default=20_000, help="Synthetic genuine scores")
+    parser.add_argument("--impostor", type=int, default=2_000_000, help="Synthetic impostor scores")
+    parser.add_argument("--resamples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    return _self_check(args.genuine, args.impostor, args.resamples, args.seed)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Mapping
+
+import numpy as np
+
+
+def file_digest(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bytes_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_digest(params: Mapping) -> str:
+    """Short stable digest of the parameters a cached value depends on."""
+    blob = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+class ArrayCache:
+    """Persistent key -> float32 vector store in a single SQLite file.
+
+    Vectors are stored as raw little-endian float32 blobs. A stored ``None``
+    records a negative result (e.g. no face found) so it is not recomputed,
+    optionally with the reason it was rejected; only store it for outcomes
+    the key fully determines, never for transient failures such as an
+    unreadable file. Use as a context manager (or call
+    ``close``) to release the SQLite connection.
+    Keys are namespaced by ``config_digest(params)``, so changing the model or
+    detector settings never returns stale values.
+    """
+
+    def __init__(self, path: str | Path, params: Mapping | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = config_digest(params or {})
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(vectors)")]
+        if "reason" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE vectors ADD COLUMN reason TEXT")
+            except sqlite3.OperationalError:
+                pass  # added concurrently by another process
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str], reasons: Dict[str, str] | None = None) -> Dict[str, np.ndarray | None]:
+        """Return cached entries for ``keys``; missing keys are left out.
+
+        ``reasons`` receives key -> reason for negatives stored with one.
+        """
+        keys = list(keys)
+        found: Dict[str, np.ndarray | None] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, reason FROM vectors WHERE namespace = ? AND key IN ({marks})",
+                    [self.namespace, *chunk],
+                ).fetchall()
+                for key, value, reason in rows:
+                    found[key] = None if value is None else np.frombuffer(value, dtype="<f4").copy()
+                    if value is None and reason is not None and reasons is not None:
+                        reasons[key] = reason
+        return found
+
+    def put_many(self, items: Mapping[str, np.ndarray | None], reasons: Mapping[str, str] | None = None) -> None:
+        """Store ``items`` in one transaction; ``reasons`` gives key -> reason for None values."""
+        reasons = reasons or {}
+        rows = [
+            (self.namespace, key, None if value is None else np.asarray(value, dtype="<f4").tobytes(), reasons.get(key) if value is None else None)
+            for key, value in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors (namespace, key, value, reason) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def get(self, key: str) -> np.ndarray | None:
+        return self.get_many([key]).get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.get_many([key])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "ArrayCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
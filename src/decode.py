@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# Reduced-scale image decoding. libjpeg can decode straight to 1/2, 1/4 or
+# 1/8 scale (IMREAD_REDUCED_*), skipping most of the IDCT and colour work and
+# never materialising the full-size frame. The factor is chosen from the
+# JPEG's SOF header, parsed without decoding, so that the image keeps at least
+# ``max_side`` pixels on its longer side. Other formats decode at full size.
+
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+HEADER_BYTES = 1 << 18  # EXIF/ICC segments come before SOF; 256 KiB covers real-world files
+
+# SOF0..SOF15 carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range.
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+ImageInput = str | Path | bytes
+
+
+def jpeg_size(data: bytes) -> Tuple[int, int] | None:
+    """(width, height) from a JPEG's SOF segment; None if ``data`` is not a JPEG or is cut short."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # standalone markers
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+    return None
+
+
+def reduction_factor(size: Tuple[int, int] | None, max_side: int | None) -> int:
+    """Largest JPEG scale-down (1, 2, 4 or 8) that keeps the longer side at or above ``max_side``."""
+    if size is None or not max_side:
+        return 1
+    longer = max(size)
+    factor = 1
+    for f in (2, 4, 8):
+        if longer // f >= max_side:
+            factor = f
+    return factor
+
+
+class DecodedImage:
+    """An image decoded at reduced scale when possible, with a full-resolution fallback.
+
+    ``image`` is the decoded array and ``scale`` the factor it was reduced
+    by (1 when decoded at full size). ``full()`` decodes the source at full
+    resolution once and returns it. ``min_face_px`` is the face size the
+    caller's ``max_side`` was chosen to preserve; smaller faces found in a
+    reduced image should be re-detected at full size.
+    """
+
+    def __init__(self, source: ImageInput | np.ndarray, max_side: int | None = None, min_face_px: int = 0):
+        self.source = source
+        self.scale = 1
+        self.min_face_px = min_face_px
+        if isinstance(source, np.ndarray):
+            self.image: np.ndarray | None = source
+            self._full = source
+            return
+        self._full = None
+        if isinstance(source, bytes):
+            header = source[:HEADER_BYTES]
+        else:
+            try:
+                with open(source, "rb") as f:
+                    header = f.read(HEADER_BYTES)
+            except OSError:
+                self.image = None
+                return
+        self.scale = reduction_factor(jpeg_size(header), max_side)
+        self.image = self._decode(REDUCED_FLAGS.get(self.scale, cv2.IMREAD_COLOR))
+        if self.scale == 1:
+            self._full = self.image
+
+    def _decode(self, flags: int) -> np.ndarray | None:
+        if isinstance(self.source, bytes):
+            return cv2.imdecode(np.frombuffer(self.source, dtype=np.uint8), flags)
+        return cv2.imread(str(self.source), flags)
+
+    @property
+    def reduced(self) -> bool:
+        return self.scale > 1
+
+    def full(self) -> np.ndarray | None:
+        if self._full is None:
+            self._full = self._decode(cv2.IMREAD_COLOR)
+        return self._full
+
@@ -5,7 +5,12 @@ from typing import List
 
 import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
+
+from .models import get_model
+from .telemetry import stage, timed
+
+
+MTCNN_KEYPOINTS = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
 
 
 @dataclass
@@ -15,6 +20,9 @@ class FaceBox:
     w: int
     h: int
     score: float = 1.0
+    # 5-point landmarks (left eye, right eye, nose, left mouth, right mouth) as
+    # a (5, 2) float32 array in image coordinates; None for backends without them.
+    landmarks: np.ndarray | None = None
 
 
 class FaceDetector:
@@ -28,11 +36,20 @@ class FaceDetector:
         min_neighbors: int = 5,
         ctx_id: int = 0,
         det_size: tuple[int, int] = (640, 640),
+        model_name: str = "buffalo_l",
+        adaptive: bool = False,
+        min_face_fraction: float = 0.2,
+        min_input_face_px: int = 64,
     ):
         self.backend = backend
         self.min_size = min_size
         self.scale_factor = scale_factor
         self.min_neighbors = min_neighbors
+        self.det_size = det_size
+        # Adaptive RetinaFace input: see ``input_size_for``.
+        self.adaptive = adaptive
+        self.min_face_fraction = min_face_fraction
+        self.min_input_face_px = min_input_face_px
 
         self._haar = None
         self._mtcnn = None
@@ -50,12 +67,35 @@ class FaceDetector:
             except Exception as exc:  # pragma: no cover
                 raise RuntimeError("MTCNN backend requires the 'mtcnn' package") from exc
         elif backend == "retinaface":
-            self._retina = FaceAnalysis(name="buffalo_l")
-            self._retina.prepare(ctx_id=ctx_id, det_size=det_size)
+            self._retina = get_model("detection", model_name=model_name, ctx_id=ctx_id)
+            if not isinstance(self._retina.input_shape[2], str):
+                # Exported with a fixed input shape; only det_size can be fed.
+                self.adaptive = False
         else:
             raise ValueError("backend must be one of: retinaface, mtcnn, haar")
 
+    def input_size_for(self, shape: tuple) -> tuple[int, int]:
+        """RetinaFace input (w, h) for an image of ``shape`` in adaptive mode.
+
+        The longer side is just large enough for a face spanning
+        ``min_face_fraction`` of the image to reach ``min_input_face_px``
+        pixels, capped by ``det_size`` and by the image itself (upscaling
+        finds nothing new). The shorter side follows the aspect ratio, so
+        no letterbox padding is run through the network.
+        """
+        h, w = shape[:2]
+        cap = max(self.det_size)
+        wanted = int(np.ceil(self.min_input_face_px / self.min_face_fraction))
+        side = min(cap, wanted, max(h, w))
+        side = max(32, -(-side // 32) * 32)
+        scale = side / max(h, w)
+        return max(32, -(-int(w * scale) // 32) * 32), max(32, -(-int(h * scale) // 32) * 32)
+
     def detect_faces(self, image_bgr: np.ndarray) -> List[FaceBox]:
+        with stage("detect", self.backend):
+            return self._detect_faces(image_bgr)
+
+    def _detect_faces(self, image_bgr: np.ndarray) -> List[FaceBox]:
         if self.backend == "haar":
             gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
             boxes = self._haar.detectMultiScale(
@@ -73,18 +113,126 @@ class FaceDetector:
             for r in results:
                 x, y, w, h = r.get("box", [0, 0, 0, 0])
                 score = float(r.get("confidence", 1.0))
-                boxes.append(FaceBox(int(x), int(y), int(w), int(h), score))
+                kp = r.get("keypoints")
+                landmarks = None
+                if kp:
+                    landmarks = np.array([kp[k] for k in MTCNN_KEYPOINTS], dtype=np.float32)
+                boxes.append(FaceBox(int(x), int(y), int(w), int(h), score, landmarks))
             return boxes
 
-        faces = self._retina.get(image_bgr)
+        size = self.input_size_for(image_bgr.shape) if self.adaptive else self.det_size
+        dets, kpss = self._retina.detect(image_bgr, input_size=size)
+        if len(dets) == 0 and tuple(size) != tuple(self.det_size):
+            # Face smaller than expected: retry at the full input size.
+            dets, kpss = self._retina.detect(image_bgr, input_size=self.det_size)
         boxes = []
-        for f in faces:
-            x1, y1, x2, y2 = f.bbox.astype(int)
-            boxes.append(FaceBox(int(x1), int(y1), int(x2 - x1), int(y2 - y1), float(f.det_score)))
+        for i, det in enumerate(dets):
+            x1, y1, x2, y2 = det[:4].astype(int)
+            landmarks = kpss[i].astype(np.float32) if kpss is not None else None
+            boxes.append(FaceBox(int(x1), int(y1), int(x2 - x1), int(y2 - y1), float(det[4]), landmarks))
         return boxes
 
 
+def detector_from_config(config: dict) -> FaceDetector:
+    """FaceDetector from the ``detector`` config section (backend and ``adaptive`` settings)."""
+    section = config.get("detector", {})
+    adaptive = section.get("adaptive") or {}
+    return FaceDetector(
+        backend=section.get("backend", "retinaface"),
+        adaptive=adaptive.get("enabled", False),
+        min_face_fraction=adaptive.get("min_face_fraction", 0.2),
+        min_input_face_px=adaptive.get("min_input_face_px", 64),
+    )
+
+
 def select_largest_face(boxes: List[FaceBox]) -> FaceBox | None:
     if not boxes:
         return None
     return max(boxes, key=lambda b: b.w * b.h)
+
+
+class FaceTracker:
+    """Per-frame face boxes from sparse detection plus template tracking.
+
+    The detector runs on the first frame, every ``redetect_interval`` frames,
+    and whenever the template match score falls below ``min_confidence``. In
+    between, the last detected face (grayscale, downscaled to about
+    ``template_width`` px) is located with normalised cross-correlation inside
+    a window ``search_margin`` box-widths around the previous box; landmarks
+    are shifted with the box.
+    """
+
+    def __init__(
+        self,
+        detector: FaceDetector,
+        redetect_interval: int = 10,
+        min_confidence: float = 0.6,
+        search_margin: float = 0.25,
+        template_width: int = 48,
+    ):
+        self.detector = detector
+        self.redetect_interval = max(1, redetect_interval)
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.template_width = template_width
+        self.reset()
+
+    def reset(self) -> None:
+        self._box: FaceBox | None = None
+        self._template: np.ndarray | None = None
+        self._scale = 1.0
+        self._offset = (0, 0)
+        self._since_detect = 0
+
+    def _detect(self, frame_bgr: np.ndarray, gray: np.ndarray) -> FaceBox | None:
+        self._since_detect = 0
+        face = select_largest_face(self.detector.detect_faces(frame_bgr))
+        if face is None:
+            # Hold the previous box until the next scheduled detection.
+            return self._box
+        h, w = gray.shape
+        x1, y1 = max(0, face.x), max(0, face.y)
+        x2, y2 = min(w, face.x + face.w), min(h, face.y + face.h)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            self._template = None
+        else:
+            self._scale = min(1.0, self.template_width / float(x2 - x1))
+            self._template = cv2.resize(gray[y1:y2, x1:x2], None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+            # Where the (border-clipped) template sits inside the face box.
+            self._offset = (x1 - face.x, y1 - face.y)
+        self._box = face
+        return face
+
+    @timed("track")
+    def _track(self, gray: np.ndarray) -> FaceBox | None:
+        box = self._box
+        tpl = self._template
+        h, w = gray.shape
+        mx = int(round(box.w * self.search_margin))
+        my = int(round(box.h * self.search_margin))
+        x1, y1 = max(0, box.x - mx), max(0, box.y - my)
+        x2, y2 = min(w, box.x + box.w + mx), min(h, box.y + box.h + my)
+        window = cv2.resize(gray[y1:y2, x1:x2], None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        if window.shape[0] < tpl.shape[0] or window.shape[1] < tpl.shape[1]:
+            return None
+        result = cv2.matchTemplate(window, tpl, cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        if score < self.min_confidence:
+            return None
+        nx = x1 + int(round(loc[0] / self._scale)) - self._offset[0]
+        ny = y1 + int(round(loc[1] / self._scale)) - self._offset[1]
+        dx, dy = nx - box.x, ny - box.y
+        landmarks = None if box.landmarks is None else box.landmarks + np.array([dx, dy], dtype=np.float32)
+        self._box = FaceBox(nx, ny, box.w, box.h, float(score), landmarks)
+        return self._box
+
+    def update(self, frame_bgr: np.ndarray) -> FaceBox | None:
+        """Box for the next frame of the sequence; None until a face has been found."""
+        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        self._since_detect += 1
+        if self._box is None or self._template is None or self._since_detect >= self.redetect_interval:
+            return self._detect(frame_bgr, gray)
+        tracked = self._track(gray)
+        if tracked is None:
+            return self._detect(frame_bgr, gray)
+        return tracked
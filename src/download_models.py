@@ -1,29 +1,136 @@
 from __future__ import annotations
 
 import argparse
+import time
 from pathlib import Path
 
-from insightface.app import FaceAnalysis
+import numpy as np
 
+from .models import GRAPH_OPTIMIZATION, TASKS, find_onnx_file, get_model, model_dir, session_options, variant_file
 
-def download_retinaface(model_name: str = "buffalo_l", ctx_id: int = -1, det_size: tuple[int, int] = (640, 640)) -> Path:
-    app = FaceAnalysis(name=model_name)
-    app.prepare(ctx_id=ctx_id, det_size=det_size)
-    return Path(app.model_dir)
+# Besides fetching a pack, this builds the deployment artefacts that
+# ``runtime.variant`` selects: an offline graph-optimised copy of each model
+# (sessions load it with optimisation off, so start-up skips the graph
+# passes) and a dynamically int8-quantised copy. Quantisation can cost
+# accuracy, so --check-pairs re-scores a pairs CSV with both variants.
+
+
+def download_retinaface(model_name: str = "buffalo_l", ctx_id: int = -1) -> Path:
+    directory = model_dir(model_name)
+    for task in TASKS:
+        get_model(task, model_name=model_name, ctx_id=ctx_id)
+    return Path(directory)
+
+
+def optimize_model(onnx_file: str, level: str = "extended") -> str:
+    """Serialise ORT's optimised graph next to ``onnx_file``; returns the new path.
+
+    "all" adds layout transforms tied to the CPU that ran them, so the
+    default stops at "extended" for artefacts copied between machines.
+    """
+    import onnxruntime
+
+    out = variant_file(onnx_file, "optimized")
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION[level])
+    options.optimized_model_filepath = out
+    onnxruntime.InferenceSession(onnx_file, sess_options=options, providers=["CPUExecutionProvider"])
+    return out
+
+
+def quantize_model(onnx_file: str) -> str:
+    """Dynamic 8-bit quantisation of ``onnx_file``; returns the new path.
+
+    Weights are stored as uint8 (ORT's CPU ConvInteger kernel has no int8
+    weight path); activation ranges are computed per batch at run time.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out = variant_file(onnx_file, "int8")
+    quantize_dynamic(onnx_file, out, weight_type=QuantType.QUInt8)
+    return out
+
+
+def _dummy_input(shape) -> np.ndarray:
+    # Dynamic batch -> 1, dynamic spatial dims -> 640 (the detector's default input).
+    dims = [d if isinstance(d, int) and d > 0 else (1 if i == 0 else 640) for i, d in enumerate(shape)]
+    return np.random.default_rng(0).random(dims, dtype=np.float32)
+
+
+def session_timings(onnx_file: str, runs: int = 10) -> tuple[float, float]:
+    """(session start-up ms, median single-input run ms) with the configured session options."""
+    import onnxruntime
+
+    start = time.perf_counter()
+    session = onnxruntime.InferenceSession(onnx_file, sess_options=session_options(onnx_file), providers=["CPUExecutionProvider"])
+    load_ms = (time.perf_counter() - start) * 1000
+    feed = {inp.name: _dummy_input(inp.shape) for inp in session.get_inputs()}
+    session.run(None, feed)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, feed)
+        times.append((time.perf_counter() - start) * 1000)
+    return load_ms, float(np.median(times))
+
+
+def check_pairs(pairs_csv: str, variant: str, batch_size: int = 64) -> dict:
+    """EER and TAR@FAR=1e-3 of the fp32 models and of ``variant`` on the same pairs."""
+    from .eval_metrics import compute_pair_scores, load_pairs
+    from .metrics import equal_error_rate, error_curve, fnr_at_fpr
+
+    pairs = load_pairs(Path(pairs_csv))
+    report = {}
+    kept_scores = {}
+    for name in ("fp32", variant):
+        scores, labels, kept = compute_pair_scores(pairs, batch_size=batch_size, runtime={"variant": name})
+        curve = error_curve(scores, labels)
+        report[name] = {"pairs": len(scores), "eer": equal_error_rate(curve)[0], "tar@far=1e-3": 1.0 - fnr_at_fpr(curve, 1e-3)[0]}
+        kept_scores[name] = dict(zip(kept, scores))
+    common = sorted(set(kept_scores["fp32"]) & set(kept_scores[variant]))
+    diff = np.abs([kept_scores["fp32"][i] - kept_scores[variant][i] for i in common]) if common else np.zeros(1)
+    report["max_score_diff"] = float(diff.max())
+    report["eer_increase"] = report[variant]["eer"] - report["fp32"]["eer"]
+    return report
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Download InsightFace/RetinaFace models")
     parser.add_argument("--model", default="buffalo_l", help="InsightFace model pack name")
     parser.add_argument("--cpu", action="store_true", help="Force CPU download/prepare")
-    parser.add_argument("--det-size", default="640,640", help="Detector input size, e.g. 640,640")
+    parser.add_argument("--optimize", action="store_true", help="Write graph-optimised <model>.opt.onnx files")
+    parser.add_argument("--opt-level", default="extended", choices=list(GRAPH_OPTIMIZATION), help="ORT optimisation level to serialise")
+    parser.add_argument("--quantize", action="store_true", help="Write dynamic int8 <model>.int8.onnx files")
+    parser.add_argument("--check-pairs", default=None, help="Pairs CSV (eval_metrics format) to compare fp32 and int8 accuracy")
+    parser.add_argument("--max-eer-increase", type=float, default=0.005, help="Fail --check-pairs above this EER increase")
     args = parser.parse_args()
 
-    det_w, det_h = [int(x) for x in args.det_size.split(",")]
     ctx_id = -1 if args.cpu else 0
 
-    model_dir = download_retinaface(args.model, ctx_id=ctx_id, det_size=(det_w, det_h))
+    model_dir = download_retinaface(args.model, ctx_id=ctx_id)
     print(f"Downloaded to: {model_dir}")
+
+    for task in TASKS:
+        base = find_onnx_file(task, args.model)
+        built = {"fp32": base}
+        if args.optimize:
+            built["optimized"] = optimize_model(base, args.opt_level)
+        if args.quantize:
+            built["int8"] = quantize_model(base)
+        for name, path in built.items():
+            if len(built) > 1:
+                load_ms, run_ms = session_timings(path)
+                print(f"{task:<12}{name:<10}{Path(path).stat().st_size / 2**20:>8.1f} MiB  load {load_ms:7.1f} ms  run {run_ms:7.1f} ms  {path}")
+
+    if args.check_pairs:
+        report = check_pairs(args.check_pairs, "int8")
+        for name in ("fp32", "int8"):
+            r = report[name]
+            print(f"{name}: pairs={r['pairs']} EER={r['eer']:.4f} TAR@FAR=1e-3={r['tar@far=1e-3']:.4f}")
+        print(f"EER increase: {report['eer_increase']:+.4f}, max |score diff|: {report['max_score_diff']:.4f}")
+        if report["eer_increase"] > args.max_eer_increase:
+            print(f"int8 models exceed the allowed EER increase ({args.max_eer_increase}); keep runtime.variant: fp32")
+            return 1
     return 0
 
 
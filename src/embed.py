@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import Sequence
 
+import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
+
+from .align import align_face
+from .detect import FaceBox
+from .models import get_model, model_version, session_variant
+from .telemetry import stage
 
 
 @dataclass
@@ -12,18 +18,51 @@ class FaceEmbedding:
 
 
 class FaceEmbedder:
-    """ArcFace/InsightFace embedding wrapper."""
+    """ArcFace/InsightFace embedding wrapper.
+
+    Runs only the recognition session; faces are expected to be aligned crops
+    (see ``align.align_face``), so no second detector pass is needed.
+    """
+
+    def __init__(self, model_name: str = "buffalo_l", ctx_id: int = 0, batch_size: int = 64):
+        self.model_name = model_name
+        self.rec_model = get_model("recognition", model_name=model_name, ctx_id=ctx_id)
+        self.input_size = tuple(self.rec_model.input_size)
+        # Embedding width, from the graph's (batch, D) output.
+        self.dim = int(self.rec_model.output_shape[-1])
+        self.batch_size = max(1, batch_size)
+
+    @property
+    def model_version(self) -> str:
+        """Tag of the loaded recognition model (see ``models.model_version``)."""
+        return model_version(self.rec_model.model_file)
 
-    def __init__(self, model_name: str = "buffalo_l", ctx_id: int = 0, det_size: tuple[int, int] = (640, 640)):
-        self.app = FaceAnalysis(name=model_name)
-        self.app.prepare(ctx_id=ctx_id, det_size=det_size)
+    def _fit(self, face_bgr: np.ndarray) -> np.ndarray:
+        if face_bgr.shape[1::-1] != self.input_size:
+            face_bgr = cv2.resize(face_bgr, self.input_size, interpolation=cv2.INTER_LINEAR)
+        return face_bgr
+
+    def embed_batch(self, faces: Sequence[np.ndarray], batch_size: int | None = None) -> np.ndarray:
+        """Embed aligned face crops, ``batch_size`` crops per ONNX run.
+
+        Returns an (N, D) float32 array of L2-normalised rows.
+        """
+        batch_size = max(1, batch_size or self.batch_size)
+        out = []
+        for start in range(0, len(faces), batch_size):
+            chunk = [self._fit(f) for f in faces[start : start + batch_size]]
+            with stage("embed", session_variant()):
+                out.append(self.rec_model.get_feat(chunk).astype(np.float32))
+        if not out:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        emb = np.concatenate(out, axis=0)
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True) + 1e-9
+        return emb
 
     def embed(self, face_bgr: np.ndarray) -> FaceEmbedding:
-        faces = self.app.get(face_bgr)
-        if not faces:
-            return FaceEmbedding(vector=np.zeros((512,), dtype=np.float32))
-        face = max(faces, key=lambda f: f.bbox[2] * f.bbox[3])
-        emb = face.embedding.astype(np.float32)
-        norm = np.linalg.norm(emb) + 1e-9
-        emb = emb / norm
-        return FaceEmbedding(vector=emb)
+        """Embed an aligned face crop (resized to the model input if needed)."""
+        return FaceEmbedding(vector=self.embed_batch([face_bgr])[0])
+
+    def embed_face(self, image_bgr: np.ndarray, box: FaceBox) -> FaceEmbedding:
+        """Align ``box`` in ``image_bgr`` with its detector landmarks and embed it."""
+        return self.embed(align_face(image_bgr, box, self.input_size))
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Mapping, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# Columnar on-disk store of face embeddings.
+#
+# A store is a directory of flat files, each memory-mapped:
+#   header.json     format, dim, storage dtype, row count, capacity,
+#                   model version, extra column specs
+#   vectors.bin     (capacity, dim) float32 / float16 / int8 rows
+#   scales.bin      (capacity,) float32 per-row scale (int8 only)
+#   ids.bin         (capacity,) int64 external id per row
+#   det_score.bin   (capacity,) float32 detector confidence (NaN = unknown)
+#   quality.bin     (capacity,) float32 face quality score (NaN = unknown)
+#   <extra>.bin     columns declared by the owner (e.g. the gallery's tombstones)
+# Rows are append-only. Column data is written first and the header's row
+# count is replaced atomically afterwards, so a crash mid-append leaves the
+# previous rows intact. Opening a store maps the files without reading them;
+# pages are loaded on first access and shared through the page cache.
+
+FORMAT = 1
+DTYPES = ("float32", "float16", "int8")
+HEADER = "header.json"
+
+# name -> (dtype, fill value for rows not written yet)
+BASE_COLUMNS: Dict[str, Tuple[str, float]] = {
+    "ids": ("int64", 0),
+    "det_score": ("float32", np.nan),
+    "quality": ("float32", np.nan),
+}
+
+
+class StaleStoreError(ValueError):
+    """Store written by a different embedding model than the one requested."""
+
+
+def as_float32(block: np.ndarray) -> np.ndarray:
+    """Stored rows as float32. NumPy's float16 cast is slow without F16C; OpenCV's is vectorised."""
+    if block.dtype == np.float16 and block.ndim == 2 and len(block):
+        return cv2.multiply(np.ascontiguousarray(block), 1.0, dtype=cv2.CV_32F)
+    return np.asarray(block, dtype=np.float32)
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped matrix of embeddings plus per-row columns.
+
+    ``model_version`` (see ``models.model_version``) is recorded when the
+    store is created; opening it with a different version raises
+    StaleStoreError so embeddings from two models are never mixed. Pass
+    None to skip the check. ``columns`` declares owner-specific per-row
+    columns as ``{name: (dtype, fill)}``.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        dim: int = 512,
+        dtype: str = "float16",
+        model_version: str | None = None,
+        columns: Mapping[str, Tuple[str, float]] | None = None,
+        readonly: bool = False,
+    ):
+        self.path = Path(path)
+        self.readonly = readonly
+        header_path = self.path / HEADER
+        if header_path.exists():
+            with open(header_path, "r", encoding="utf-8") as f:
+                self.header = json.load(f)
+            stored = self.header.get("model_version")
+            if model_version is not None and stored != model_version:
+                raise StaleStoreError(f"{self.path} holds {stored or 'unversioned'} embeddings, expected {model_version}")
+        else:
+            if readonly:
+                raise FileNotFoundError(f"No embedding store at {self.path}")
+            if dtype not in DTYPES:
+                raise ValueError(f"dtype must be one of: {', '.join(DTYPES)}")
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.header = {
+                "format": FORMAT,
+                "dim": dim,
+                "dtype": dtype,
+                "count": 0,
+                "capacity": 0,
+                "model_version": model_version,
+                "columns": {name: list(spec) for name, spec in (columns or {}).items()},
+            }
+            self._write_header()
+        if self.header.get("format", FORMAT) > FORMAT:
+            raise ValueError(f"{self.path} uses store format {self.header['format']}, newer than {FORMAT}")
+        self.dim = self.header["dim"]
+        self.dtype = self.header["dtype"]
+        self.model_version = self.header.get("model_version")
+        self._maps: Dict[str, np.memmap] = {}
+        self._open_maps(self.header["capacity"])
+
+    # -- storage ---------------------------------------------------------
+
+    def _columns(self) -> Dict[str, Tuple[np.dtype, tuple, float]]:
+        cols = {"vectors": (np.dtype(self.dtype), (self.dim,), 0)}
+        if self.dtype == "int8":
+            cols["scales"] = (np.dtype(np.float32), (), 0)
+        for name, (dtype, fill) in {**BASE_COLUMNS, **self.header.get("columns", {})}.items():
+            cols[name] = (np.dtype(dtype), (), fill)
+        return cols
+
+    def _open_maps(self, capacity: int) -> None:
+        self._maps = {}
+        if capacity == 0:
+            return
+        mode = "r" if self.readonly else "r+"
+        for name, (dtype, tail, _) in self._columns().items():
+            self._maps[name] = np.memmap(self.path / f"{name}.bin", dtype=dtype, mode=mode, shape=(capacity,) + tail)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.header["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        for mm in self._maps.values():
+            mm.flush()
+        self._maps = {}
+        for name, (dtype, tail, fill) in self._columns().items():
+            row_bytes = dtype.itemsize * int(np.prod(tail, dtype=np.int64))
+            file = self.path / f"{name}.bin"
+            with open(file, "ab") as f:
+                f.truncate(new_capacity * row_bytes)
+            if fill != 0:
+                np.memmap(file, dtype=dtype, mode="r+", shape=(new_capacity,) + tail)[capacity:] = fill
+        self.header["capacity"] = new_capacity
+        self._open_maps(new_capacity)
+
+    def _write_header(self) -> None:
+        tmp = self.path / f"{HEADER}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.header, f)
+        os.replace(tmp, self.path / HEADER)
+
+    def flush(self) -> None:
+        for mm in self._maps.values():
+            mm.flush()
+        if not self.readonly:
+            self._write_header()
+
+    @property
+    def count(self) -> int:
+        return self.header["count"]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy view of the first ``count`` rows of a column (writable unless read-only)."""
+        if self.count == 0:
+            dtype, tail, _ = self._columns()[name]
+            return np.zeros((0,) + tail, dtype=dtype)
+        return self._maps[name][: self.count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.column("ids")
+
+    # -- writes ----------------------------------------------------------
+
+    def _encode(self, emb: np.ndarray) -> Tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype == "int8":
+            scales = np.abs(emb).max(axis=1) / 127.0 + 1e-12
+            return np.round(emb / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return emb.astype(self.dtype), None
+
+    def append(self, ids: Sequence[int], vectors: np.ndarray, **columns) -> np.ndarray:
+        """Append rows; ``columns`` give per-row values (or a scalar) by column name.
+
+        Returns the new row numbers.
+        """
+        if self.readonly:
+            raise PermissionError("embedding store opened read-only")
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"expected ({len(ids)}, {self.dim}) vectors, got {vectors.shape}")
+        unknown = set(columns) - set(self._columns())
+        if unknown:
+            raise KeyError(f"unknown column(s): {', '.join(sorted(unknown))}")
+        start = self.count
+        end = start + len(ids)
+        self._grow(end)
+        values, scales = self._encode(vectors)
+        self._maps["vectors"][start:end] = values
+        if scales is not None:
+            self._maps["scales"][start:end] = scales
+        self._maps["ids"][start:end] = ids
+        for name, value in columns.items():
+            if value is not None:
+                self._maps[name][start:end] = value
+        self.header["count"] = end
+        self.flush()
+        return np.arange(start, end)
+
+    # -- reads -----------------------------------------------------------
+
+    def vectors(self, rows: slice | np.ndarray | None = None) -> np.ndarray:
+        """Rows decoded to float32 (a copy; use ``column("vectors")`` for the raw map)."""
+        rows = slice(0, self.count) if rows is None else rows
+        if self.count == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        block = as_float32(self._maps["vectors"][rows])
+        if self.dtype == "int8":
+            block = block * self._maps["scales"][rows][:, None]
+        return block
+
+    def lookup(self, ids: Sequence[int]) -> np.ndarray:
+        """Latest row of each id, or -1 where the id was never stored."""
+        all_ids = self.ids
+        wanted = np.asarray(ids, dtype=np.int64).ravel()
+        if len(all_ids) == 0:
+            return np.full(len(wanted), -1, dtype=np.int64)
+        # Reverse so the stable sort puts each id's latest row first.
+        order = len(all_ids) - 1 - np.argsort(all_ids[::-1], kind="stable")
+        sorted_ids = all_ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == wanted, order[pos], -1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Inspect an embedding store, or time opening it")
+    parser.add_argument("path", help="Store directory")
+    parser.add_argument("--fill", type=int, default=0, help="Append this many random rows first (benchmarking)")
+    parser.add_argument("--dtype", default="float16", choices=DTYPES, help="Storage dtype of a new store")
+    args = parser.parse_args()
+
+    if args.fill:
+        store = EmbeddingStore(args.path, dtype=args.dtype)
+        rng = np.random.default_rng(0)
+        for start in range(0, args.fill, 100_000):
+            n = min(100_000, args.fill - start)
+            store.append(np.arange(store.count, store.count + n), rng.standard_normal((n, store.dim)).astype(np.float32))
+
+    t = time.perf_counter()
+    store = EmbeddingStore(args.path, readonly=True)
+    matrix = store.column("vectors")
+    open_ms = (time.perf_counter() - t) * 1000
+    print(f"{store.path}: {store.count} x {store.dim} {store.dtype}, model={store.model_version or 'unversioned'}")
+    print(f"Opened in {open_ms:.2f} ms ({matrix.nbytes / 2**20:.1f} MiB mapped)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,16 +1,36 @@
 from __future__ import annotations
 
 import argparse
+import atexit
+import contextlib
+import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 import cv2
 import numpy as np
 
+from .bootstrap import Interval, bootstrap_histogram_intervals, bootstrap_intervals, format_interval
+from .cache import ArrayCache, config_digest, file_digest
 from .detect import FaceDetector, select_largest_face
-from .align import crop_and_resize
+from .align import align_face
 from .embed import FaceEmbedder
-from .match import cosine_similarity
+from .embed_store import EmbeddingStore
+from .match import ScoreDistributions, all_pairs_distributions, pairwise_cosine
+from .models import configure_runtime, session_variant
+from .pipeline import load_config
+from .quality import check_face, check_frame, quality_settings
+from .runner import run_sharded, shard_dir
+from .telemetry import collect
+from .metrics import (
+    curve_from_histograms,
+    curve_rates_at,
+    equal_error_rate,
+    error_curve,
+    fnr_at_fpr,
+    rates_at_threshold,
+    write_curve_csv,
+)
 
 
 def load_pairs(csv_path: Path) -> List[Tuple[str, str, int]]:
@@ -20,99 +40,456 @@ def load_pairs(csv_path: Path) -> List[Tuple[str, str, int]]:
             line = line.strip()
             if not line or line.startswith("#"):
                 continue
-            left, right, label = [x.strip() for x in line.split(",")]
+            left, right, label = [x.strip() for x in line.split(",")][:3]
             pairs.append((left, right, int(label)))
     return pairs
 
 
-def compute_scores(pairs: List[Tuple[str, str, int]]) -> Tuple[List[float], List[int]]:
-    detector = FaceDetector(backend="retinaface")
-    embedder = FaceEmbedder()
+def load_pair_subjects(csv_path: Path) -> List[str] | None:
+    """Optional 4th pairs column: subject id used for subject-disjoint bootstrap."""
+    subjects = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            cols = [x.strip() for x in line.split(",")]
+            if len(cols) < 4:
+                return None
+            subjects.append(cols[3])
+    return subjects
 
-    scores = []
-    labels = []
 
-    for left, right, label in pairs:
-        img1 = cv2.imread(left)
-        img2 = cv2.imread(right)
-        if img1 is None or img2 is None:
-            continue
+def load_identity_list(csv_path: Path) -> List[Tuple[str, str]]:
+    items = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path, identity = [x.strip() for x in line.split(",")]
+            items.append((path, identity))
+    return items
+
 
-        b1 = select_largest_face(detector.detect_faces(img1))
-        b2 = select_largest_face(detector.detect_faces(img2))
-        if b1 is None or b2 is None:
+def embedding_params(detector: FaceDetector, embedder: FaceEmbedder, quality: dict | None = None) -> dict:
+    """Everything an embedding depends on besides the image bytes."""
+    params = {
+        "model": embedder.model_name,
+        "input_size": list(embedder.input_size),
+        "detector": detector.backend,
+        "det_size": list(detector.det_size),
+        "align": "arcface5",
+    }
+    if quality is not None:
+        # Embedding stores record which images passed the gate.
+        params["quality"] = quality
+    if session_variant() != "fp32":
+        params["variant"] = session_variant()
+    return params
+
+
+def embed_images(
+    paths: Iterable[str],
+    detector: FaceDetector,
+    embedder: FaceEmbedder,
+    cache: ArrayCache | None = None,
+    quality: dict | None = None,
+    reasons: Dict[str, str] | None = None,
+    faces: Dict[str, Tuple[float, float]] | None = None,
+) -> Dict[str, np.ndarray | None]:
+    """Embed each distinct image once; returns path -> vector (None if unusable).
+
+    With a cache, images are keyed by content hash and only misses are decoded,
+    detected and embedded. New results are written back batch by batch.
+    ``quality`` (see ``quality.quality_settings``) skips images that fail the
+    capture quality gate. Unusable paths are recorded in ``reasons``
+    (``unreadable``, ``no_face`` or a quality-gate reason such as ``blurry``).
+    ``faces`` receives path -> (detector score, face size in px) for images
+    detected in this call (not for cache hits).
+    """
+    reasons = {} if reasons is None else reasons
+    by_digest: Dict[str, List[str]] = {}
+    vectors: Dict[str, np.ndarray | None] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            by_digest.setdefault(file_digest(path), []).append(path)
+        except OSError:
+            vectors[path] = None
+            reasons[path] = "unreadable"
+
+    cached = cache.get_many(by_digest) if cache is not None else {}
+    for digest, vec in cached.items():
+        for path in by_digest[digest]:
+            vectors[path] = vec
+            if vec is None:
+                reasons[path] = "no_face"
+
+    crops = []
+    keys = []
+
+    def flush() -> None:
+        emb = embedder.embed_batch(crops)
+        results = dict(zip(keys, emb))
+        for digest, vec in results.items():
+            for path in by_digest[digest]:
+                vectors[path] = vec
+        if cache is not None:
+            cache.put_many(results)
+        crops.clear()
+        keys.clear()
+
+    misses = {}
+    for digest, digest_paths in by_digest.items():
+        if digest in cached:
+            continue
+        image = cv2.imread(digest_paths[0])
+        box = None
+        if image is None:
+            reason = "unreadable"
+        else:
+            reason = check_frame(image, quality).reason if quality is not None else None
+        if reason is None:
+            box = select_largest_face(detector.detect_faces(image))
+            if box is None:
+                reason = "no_face"
+            elif quality is not None:
+                reason = check_face(box, quality).reason
+        if reason is not None:
+            if reason == "no_face":
+                # Unreadable files may be transient and gate rejections would lose their reason.
+                misses[digest] = None
+            for path in digest_paths:
+                vectors[path] = None
+                reasons[path] = reason
             continue
+        if faces is not None:
+            for path in digest_paths:
+                faces[path] = (box.score, float(min(box.w, box.h)))
+        crops.append(align_face(image, box))
+        keys.append(digest)
+        if len(crops) >= embedder.batch_size:
+            flush()
 
-        f1 = crop_and_resize(img1, b1)
-        f2 = crop_and_resize(img2, b2)
+    if crops:
+        flush()
+    if cache is not None and misses:
+        cache.put_many(misses)
+    return vectors
 
-        e1 = embedder.embed(f1)
-        e2 = embedder.embed(f2)
-        sim = cosine_similarity(e1, e2)
 
-        scores.append(sim)
-        labels.append(label)
+def _pair_context(
+    batch_size: int, cache_path: str | None, threads: int, quality: dict | None = None, runtime: dict | None = None
+):
+    configure_runtime(runtime, intra_op_threads=threads)
+    detector = FaceDetector(backend="retinaface")
+    embedder = FaceEmbedder(batch_size=batch_size)
+    cache = ArrayCache(cache_path, embedding_params(detector, embedder, quality)) if cache_path else None
+    return detector, embedder, cache, quality
 
-    return scores, labels
 
+def _init_pair_worker(
+    batch_size: int, cache_path: str | None, threads: int, quality: dict | None = None, runtime: dict | None = None
+):
+    ctx = _pair_context(batch_size, cache_path, threads, quality, runtime)
+    if ctx[2] is not None:
+        # The worker keeps its cache for all its shards; release it when the process exits.
+        atexit.register(ctx[2].close)
+    return ctx
 
-def far_frr_at_threshold(scores: List[float], labels: List[int], threshold: float) -> Tuple[float, float]:
-    fa = 0
-    fr = 0
-    pos = 0
-    neg = 0
-
-    for s, y in zip(scores, labels):
-        if y == 1:
-            pos += 1
-            if s < threshold:
-                fr += 1
+
+def _score_pair_shard(ctx, start: int, pairs: List[Tuple[str, str, int]]) -> List[dict]:
+    detector, embedder, cache, quality = ctx
+    reasons: Dict[str, str] = {}
+    vectors = embed_images([p for left, right, _ in pairs for p in (left, right)], detector, embedder, cache, quality, reasons)
+    rows = []
+    for offset, (left, right, label) in enumerate(pairs):
+        score = None
+        if vectors[left] is not None and vectors[right] is not None:
+            score = float(pairwise_cosine(vectors[left][None], vectors[right][None])[0])
+        rows.append({"index": start + offset, "label": label, "score": score, "skipped": reasons.get(left) or reasons.get(right)})
+    return rows
+
+
+def compute_pair_scores(
+    pairs: List[Tuple[str, str, int]],
+    batch_size: int = 64,
+    cache_path: str | Path | None = None,
+    workers: int = 1,
+    out_dir: str | Path | None = None,
+    shard_size: int = 1000,
+    quality: dict | None = None,
+    runtime: dict | None = None,
+    reasons: Dict[int, str] | None = None,
+) -> Tuple[List[float], List[int], List[int]]:
+    """Like ``compute_scores`` but also returns the indices of the scored pairs.
+
+    With ``out_dir`` or ``workers > 1`` pairs are scored in resumable shards
+    by a process pool (see ``runner.run_sharded``). Pairs with an image
+    rejected by the ``quality`` gate are dropped like pairs without a face;
+    ``reasons`` receives pair index -> why its (first) unusable image was skipped.
+    ``runtime`` is the ONNX Runtime config section (``models.configure_runtime``).
+    """
+    reasons = {} if reasons is None else reasons
+    if workers > 1 or out_dir is not None:
+        threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+        init_args = (batch_size, str(cache_path) if cache_path else None, threads, quality, runtime)
+        with shard_dir(out_dir) as run_dir:
+            params = {"detector": "retinaface", "quality": quality, "variant": (runtime or {}).get("variant", "fp32")}
+            rows = run_sharded(pairs, _score_pair_shard, _init_pair_worker, init_args, run_dir, shard_size, workers, params=params)
+        for r in rows:
+            if r["score"] is None:
+                reasons[r["index"]] = r.get("skipped") or "no_face"
+        rows = [r for r in rows if r["score"] is not None]
+        return [r["score"] for r in rows], [r["label"] for r in rows], [r["index"] for r in rows]
+
+    detector, embedder, cache, quality = _pair_context(batch_size, str(cache_path) if cache_path else None, 0, quality, runtime)
+    paths = [p for left, right, _ in pairs for p in (left, right)]
+    image_reasons: Dict[str, str] = {}
+    try:
+        vectors = embed_images(paths, detector, embedder, cache, quality, image_reasons)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    kept = []
+    for i, (left, right, _) in enumerate(pairs):
+        if vectors[left] is not None and vectors[right] is not None:
+            kept.append(i)
         else:
-            neg += 1
-            if s >= threshold:
-                fa += 1
+            reasons[i] = image_reasons.get(left) or image_reasons.get(right)
+    if not kept:
+        return [], [], []
+    left_emb = np.stack([vectors[pairs[i][0]] for i in kept])
+    right_emb = np.stack([vectors[pairs[i][1]] for i in kept])
+    scores = pairwise_cosine(left_emb, right_emb).tolist()
+    labels = [pairs[i][2] for i in kept]
+    return scores, labels, kept
 
-    far = fa / max(neg, 1)
-    frr = fr / max(pos, 1)
-    return far, frr
 
+def compute_scores(
+    pairs: List[Tuple[str, str, int]],
+    batch_size: int = 64,
+    cache_path: str | Path | None = None,
+    workers: int = 1,
+    out_dir: str | Path | None = None,
+) -> Tuple[List[float], List[int]]:
+    scores, labels, _ = compute_pair_scores(pairs, batch_size=batch_size, cache_path=cache_path, workers=workers, out_dir=out_dir)
+    return scores, labels
 
-def find_eer(scores: List[float], labels: List[int]) -> Tuple[float, float]:
-    thresholds = np.linspace(0.0, 1.0, 201)
-    best_thr = 0.0
-    best_gap = 1.0
-    best_eer = 1.0
 
-    for thr in thresholds:
-        far, frr = far_frr_at_threshold(scores, labels, thr)
-        gap = abs(far - frr)
-        if gap < best_gap:
-            best_gap = gap
-            best_thr = thr
-            best_eer = (far + frr) / 2.0
+def digest_id(digest: str) -> int:
+    """Non-negative int64 id of a content digest (``cache.file_digest``), for embedding stores."""
+    return int(digest[:15], 16)
+
+
+def store_version(detector: FaceDetector, embedder: FaceEmbedder, quality: dict | None = None) -> str:
+    """Embedding-store version tag: the ArcFace model plus everything else the vectors depend on."""
+    return f"{embedder.model_version}+{config_digest(embedding_params(detector, embedder, quality))}"
+
+
+def stored_embeddings(
+    paths: List[str],
+    detector: FaceDetector,
+    embedder: FaceEmbedder,
+    store: EmbeddingStore,
+    cache: ArrayCache | None = None,
+    quality: dict | None = None,
+    reasons: Dict[str, str] | None = None,
+) -> Dict[str, np.ndarray | None]:
+    """``embed_images`` backed by an embedding store keyed by image content.
+
+    Rows are keyed by the file digest, so an image edited or replaced in
+    place is embedded again. Images already in the store are read from the
+    memory map; the rest are embedded and appended with their detector
+    score and face size (``det_score`` / ``quality`` columns; NaN for cache
+    hits). The quality gate only screens new images. Open the store with
+    ``store_version`` so vectors from other settings are never mixed.
+    """
+    ids: Dict[str, int] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            ids[path] = digest_id(file_digest(path))
+        except OSError:
+            pass  # embed_images reports it as unreadable
+    known = list(ids)
+    rows = store.lookup([ids[p] for p in known])
+    found = rows >= 0
+    vectors: Dict[str, np.ndarray | None] = dict(zip([p for p, hit in zip(known, found) if hit], store.vectors(rows[found])))
+    faces: Dict[str, Tuple[float, float]] = {}
+    new = embed_images([p for p in dict.fromkeys(paths) if p not in vectors], detector, embedder, cache, quality, reasons, faces)
+    ok = {ids[p]: p for p, vec in new.items() if vec is not None and p in ids}
+    if ok:
+        nan = (np.nan, np.nan)
+        store.append(
+            list(ok),
+            np.stack([new[p] for p in ok.values()]),
+            det_score=[faces.get(p, nan)[0] for p in ok.values()],
+            quality=[faces.get(p, nan)[1] for p in ok.values()],
+        )
+    vectors.update(new)
+    return vectors
 
-    return best_eer, best_thr
+
+def compute_distributions(
+    items: List[Tuple[str, str]],
+    batch_size: int = 64,
+    cache_path: str | Path | None = None,
+    max_block_bytes: int = 256 << 20,
+    bins: int | None = None,
+    store_path: str | Path | None = None,
+    quality: dict | None = None,
+    runtime: dict | None = None,
+    reasons: Dict[str, str] | None = None,
+) -> ScoreDistributions | None:
+    """Embed an identity-labelled image list once and score all pairs.
+
+    With ``store_path``, embeddings persist in an ``EmbeddingStore`` tied to
+    the loaded ArcFace model, so re-runs skip decoding and detection.
+    Skipped images are recorded in ``reasons`` (see ``embed_images``).
+    """
+    configure_runtime(runtime)
+    detector = FaceDetector(backend="retinaface")
+    embedder = FaceEmbedder(batch_size=batch_size)
+    paths = [path for path, _ in items]
+    with contextlib.ExitStack() as stack:
+        cache = stack.enter_context(ArrayCache(cache_path, embedding_params(detector, embedder, quality))) if cache_path else None
+        if store_path:
+            store = EmbeddingStore(store_path, dim=embedder.dim, dtype="float32", model_version=store_version(detector, embedder, quality))
+            vectors = stored_embeddings(paths, detector, embedder, store, cache, quality, reasons)
+        else:
+            vectors = embed_images(paths, detector, embedder, cache, quality, reasons)
+    valid = [(vectors[path], identity) for path, identity in dict(items).items() if vectors[path] is not None]
+    if len(valid) < 2:
+        return None
+    embeddings = np.stack([v for v, _ in valid])
+    identities = [identity for _, identity in valid]
+    return all_pairs_distributions(embeddings, identities, max_block_bytes=max_block_bytes, bins=bins)
+
+
+def far_frr_at_threshold(scores: List[float], labels: List[int], threshold: float) -> Tuple[float, float]:
+    return rates_at_threshold(scores, labels, threshold)
+
+
+def find_eer(scores: List[float], labels: List[int]) -> Tuple[float, float]:
+    return equal_error_rate(error_curve(scores, labels))
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Compute FAR/FRR/EER from image pairs")
-    parser.add_argument("--pairs", required=True, help="CSV: img1,img2,label(1=same,0=diff)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pairs", help="CSV: img1,img2,label(1=same,0=diff)[,subject]")
+    source.add_argument("--list", help="CSV: img,identity; scores every pair of images")
     parser.add_argument("--threshold", type=float, default=0.40, help="Cosine threshold")
+    parser.add_argument("--batch-size", type=int, default=64, help="Faces per ArcFace run")
+    parser.add_argument("--cache", default=None, help="SQLite embedding cache file (reused across runs)")
+    parser.add_argument("--config", default=None, help="Thresholds YAML for the quality gate and ONNX Runtime settings (default: neither)")
+    parser.add_argument("--store", default=None, help="Embedding store directory reused across runs (--list)")
+    parser.add_argument("--block-mb", type=int, default=256, help="Memory budget per score block (--list)")
+    parser.add_argument("--bins", type=int, default=None, help="Histogram bins over [-1,1] instead of raw scores (--list)")
+    parser.add_argument("--far-targets", default="1e-2,1e-3,1e-4,1e-5,1e-6", help="Comma-separated FAR points for TAR@FAR")
+    parser.add_argument("--curve-out", default=None, help="Write threshold,far,frr CSV (ROC/DET data)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for --pairs scoring")
+    parser.add_argument("--out-dir", default=None, help="Directory for resumable score shards (--pairs)")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Pairs per shard")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Bootstrap resamples for confidence intervals (0=off)")
+    parser.add_argument("--subject-disjoint", action="store_true", help="Resample subjects instead of pairs (--pairs with subject column)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of bootstrap intervals")
+    parser.add_argument("--metrics-out", default=None, help="Write per-stage latency histograms (Prometheus text) here")
     args = parser.parse_args()
 
-    pairs = load_pairs(Path(args.pairs))
-    scores, labels = compute_scores(pairs)
-    if not scores:
-        print("No valid pairs processed")
-        return 1
+    far_targets = [float(x) for x in args.far_targets.split(",") if x]
+    config = load_config(Path(args.config)) if args.config else {}
+    quality = quality_settings(config)
+    runtime = config.get("runtime")
+    intervals = {}
+    reasons: Dict = {}
+    if args.list:
+        with collect(args.metrics_out, config.get("telemetry")):
+            dist = compute_distributions(
+                load_identity_list(Path(args.list)),
+                batch_size=args.batch_size,
+                cache_path=args.cache,
+                max_block_bytes=args.block_mb << 20,
+                bins=args.bins,
+                store_path=args.store,
+                quality=quality,
+                runtime=runtime,
+                reasons=reasons,
+            )
+        if dist is None:
+            print("No valid images processed")
+            return 1
+        if dist.edges is not None:
+            curve = curve_from_histograms(dist.genuine, dist.impostor, dist.edges)
+            if args.bootstrap:
+                intervals = bootstrap_histogram_intervals(
+                    dist.genuine, dist.impostor, dist.edges, args.threshold,
+                    n_resamples=args.bootstrap, fpr_targets=far_targets, confidence=args.confidence,
+                )
+        else:
+            scores = np.concatenate([dist.genuine, dist.impostor])
+            labels = np.concatenate([np.ones(len(dist.genuine), dtype=np.int8), np.zeros(len(dist.impostor), dtype=np.int8)])
+            curve = error_curve(scores, labels)
+            if args.bootstrap:
+                intervals = bootstrap_intervals(
+                    scores, labels, args.threshold,
+                    n_resamples=args.bootstrap, fpr_targets=far_targets, confidence=args.confidence,
+                )
+        print(f"Genuine pairs: {curve.n_pos}")
+        print(f"Impostor pairs: {curve.n_neg}")
+    else:
+        pairs = load_pairs(Path(args.pairs))
+        with collect(args.metrics_out, config.get("telemetry")):
+            scores, labels, kept = compute_pair_scores(
+                pairs,
+                batch_size=args.batch_size,
+                cache_path=args.cache,
+                workers=args.workers,
+                out_dir=args.out_dir,
+                shard_size=args.shard_size,
+                quality=quality,
+                runtime=runtime,
+                reasons=reasons,
+            )
+        if not scores:
+            print("No valid pairs processed")
+            return 1
+        curve = error_curve(scores, labels)
+        if args.bootstrap:
+            groups = None
+            if args.subject_disjoint:
+                subjects = load_pair_subjects(Path(args.pairs))
+                if subjects is None:
+                    print("--subject-disjoint needs a subject column in the pairs CSV")
+                    return 1
+                groups = [subjects[i] for i in kept]
+            intervals = bootstrap_intervals(
+                scores, labels, args.threshold,
+                n_resamples=args.bootstrap, groups=groups, fpr_targets=far_targets, confidence=args.confidence,
+            )
+        print(f"Pairs: {len(scores)}")
+    skipped: Dict[str, int] = {}
+    for reason in reasons.values():
+        skipped[reason] = skipped.get(reason, 0) + 1
+    if skipped:
+        print(f"Skipped: {sum(skipped.values())} ({', '.join(f'{k}={v}' for k, v in sorted(skipped.items()))})")
 
-    far, frr = far_frr_at_threshold(scores, labels, args.threshold)
-    eer, eer_thr = find_eer(scores, labels)
+    far, frr = curve_rates_at(curve, args.threshold)
+    eer, eer_thr = equal_error_rate(curve)
 
-    print(f"Pairs: {len(scores)}")
-    print(f"FAR@{args.threshold:.2f}: {far:.4f}")
-    print(f"FRR@{args.threshold:.2f}: {frr:.4f}")
-    print(f"EER: {eer:.4f} at threshold {eer_thr:.2f}")
+    print(f"FAR@{args.threshold:.2f}: {far:.4f}{format_interval(intervals.get('fpr'))}")
+    print(f"FRR@{args.threshold:.2f}: {frr:.4f}{format_interval(intervals.get('fnr'))}")
+    print(f"EER: {eer:.4f} at threshold {eer_thr:.4f}{format_interval(intervals.get('eer'))}")
+    for target in far_targets:
+        if curve.n_neg * target < 1:
+            continue
+        fnr, thr = fnr_at_fpr(curve, target)
+        ci = intervals.get(f"fnr@fpr={target:g}")
+        tar_ci = Interval(1.0 - ci.estimate, 1.0 - ci.high, 1.0 - ci.low) if ci else None
+        print(f"TAR@FAR={target:g}: {1.0 - fnr:.4f} at threshold {thr:.4f}{format_interval(tar_ci)}")
+    if args.curve_out:
+        write_curve_csv(curve, args.curve_out, fpr_name="far", fnr_name="frr")
     return 0
 
 
@@ -1,31 +1,28 @@
 from __future__ import annotations
 
 import argparse
+import atexit
+import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import cv2
+import numpy as np
 import yaml
 
-from .detect import FaceDetector, select_largest_face
+from .cache import ArrayCache, file_digest
+from .detect import FaceBox, FaceDetector, detector_from_config, select_largest_face
 from .align import crop_and_resize
-from .pad_texture import texture_score
-from .pad_freq import freq_score
-from .pad_motion import motion_score
-from .pad_rppg import rppg_snr
-from .fuse import PadScores, fuse_scores
-
-
-def read_video_frames(video_path: Path, max_frames: int = 120) -> List:
-    cap = cv2.VideoCapture(str(video_path))
-    frames = []
-    while len(frames) < max_frames:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames
+from .pad_texture import texture_scores
+from .pad_freq import freq_scores
+from .bootstrap import bootstrap_intervals, format_interval
+from .fuse import PAD_MODULES, PadScores, fuse_scores
+from .models import configure_runtime
+from .quality import check_face, check_frame, quality_settings
+from .runner import run_sharded, shard_dir
+from .telemetry import collect
+from .video import iter_face_crops, source_from_config, tracker_from_config, video_module_scores
+from .metrics import curve_rates_at, equal_error_rate, error_curve, fpr_at_fnr, rates_at_threshold, write_curve_csv
 
 
 def load_config(config_path: Path) -> dict:
@@ -40,101 +37,398 @@ def load_pad_samples(csv_path: Path) -> List[Tuple[str, int]]:
             line = line.strip()
             if not line or line.startswith("#"):
                 continue
-            path, label = [x.strip() for x in line.split(",")]
+            path, label = [x.strip() for x in line.split(",")][:2]
             samples.append((path, int(label)))
     return samples
 
 
-def score_sample(detector: FaceDetector, config: dict, path: str) -> float | None:
-    if path.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
-        frames = read_video_frames(Path(path))
-        if not frames:
-            return None
-        face = select_largest_face(detector.detect_faces(frames[0]))
-        if face is None:
-            return None
-        face_frames = [crop_and_resize(f, face) for f in frames]
-        tex = texture_score(face_frames[0], config["pad"]["texture"]["lbp_points"], config["pad"]["texture"]["lbp_radius"])
-        fq = freq_score(face_frames[0], config["pad"]["freq"]["high_freq_ratio_threshold"])
-        mot = motion_score(face_frames, config["pad"]["motion"]["mean_diff_low_threshold"], config["pad"]["motion"]["mean_diff_high_threshold"])
-        rppg = rppg_snr(face_frames)
-    else:
-        image = cv2.imread(path)
-        if image is None:
-            return None
-        face = select_largest_face(detector.detect_faces(image))
-        if face is None:
-            return None
-        face_img = crop_and_resize(image, face)
-        tex = texture_score(face_img, config["pad"]["texture"]["lbp_points"], config["pad"]["texture"]["lbp_radius"])
-        fq = freq_score(face_img, config["pad"]["freq"]["high_freq_ratio_threshold"])
-        mot = 0.0
-        rppg = 0.0
-
-    scores = PadScores(texture=tex, freq=fq, motion=mot, rppg=rppg)
+def load_sample_subjects(csv_path: Path) -> List[str] | None:
+    """Optional 3rd samples column: subject id used for subject-disjoint bootstrap."""
+    subjects = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            cols = [x.strip() for x in line.split(",")]
+            if len(cols) < 3:
+                return None
+            subjects.append(cols[2])
+    return subjects
+
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+# Image crops scored per texture/frequency kernel call (112x112x3 each, ~9.4 MB per chunk).
+CROP_CHUNK = 256
+
+
+def module_params(config: dict) -> Dict[str, dict]:
+    """Parameters each PAD module score depends on (cache namespaces)."""
+    pad = config["pad"]
+    detector = config.get("detector", {})
+    common = {
+        "detector": detector.get("backend", "retinaface"),
+        "tracking": detector.get("tracking") or {},
+        "crop": [112, 112],
+        "video": config.get("video") or {},
+    }
+    adaptive = detector.get("adaptive") or {}
+    if adaptive.get("enabled", False):
+        # Smaller detector inputs move boxes and landmarks slightly.
+        common["adaptive"] = adaptive
+    quality = quality_settings(config)
+    if quality is not None:
+        # Gate rejections are cached as "no usable face".
+        common["quality"] = quality
+    return {
+        "texture": {**common, "module": "texture", "lbp_points": pad["texture"]["lbp_points"], "lbp_radius": pad["texture"]["lbp_radius"]},
+        "freq": {**common, "module": "freq", "high_freq_ratio_threshold": pad["freq"]["high_freq_ratio_threshold"]},
+        "motion": {
+            **common,
+            "module": "motion",
+            "low": pad["motion"]["mean_diff_low_threshold"],
+            "high": pad["motion"]["mean_diff_high_threshold"],
+        },
+        "rppg": {**common, "module": "rppg"},
+    }
+
+
+class PadScoreCache:
+    """Per-module PAD scores keyed by sample content hash and module parameters.
+
+    Changing one module's parameters only invalidates that module's entries.
+    A stored ``None`` means the sample had no usable face and carries the
+    skip reason (``no_face``, ``blurry``, ...), so warm runs report the same
+    reasons as cold ones. Use as a context manager (or call ``close``).
+    """
+
+    def __init__(self, path: str | Path, config: dict):
+        self.caches = {name: ArrayCache(path, params) for name, params in module_params(config).items()}
+
+    def get_many(self, digests: List[str], reasons: Dict[str, str] | None = None) -> Dict[str, Dict[str, float]]:
+        """Cached module scores per digest; skipped samples go to ``reasons`` instead.
+
+        Negatives cached before reasons were stored count as misses and are recomputed.
+        """
+        found: Dict[str, Dict[str, float]] = {}
+        skipped: Dict[str, str] = {}
+        for name, cache in self.caches.items():
+            why: Dict[str, str] = {}
+            for digest, value in cache.get_many(digests, why).items():
+                if value is not None:
+                    found.setdefault(digest, {})[name] = float(value[0])
+                elif digest in why:
+                    skipped.setdefault(digest, why[digest])
+        for digest in skipped:
+            found.pop(digest, None)
+        if reasons is not None:
+            reasons.update(skipped)
+        return found
+
+    def put_many(self, values: Dict[str, Dict[str, float | None]], reasons: Dict[str, str] | None = None) -> None:
+        """Store module scores per digest (None = skipped, with its reason); one transaction per module."""
+        for name, cache in self.caches.items():
+            items = {
+                digest: None if scores[name] is None else np.array([scores[name]], dtype=np.float32)
+                for digest, scores in values.items()
+                if name in scores
+            }
+            if items:
+                cache.put_many(items, reasons)
+
+    def close(self) -> None:
+        for cache in self.caches.values():
+            cache.close()
+
+    def __enter__(self) -> "PadScoreCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _Screen:
+    """``iter_face_crops`` screen hook that records the quality-gate reason instead of raising."""
+
+    def __init__(self, settings: dict | None):
+        self.settings = settings
+        self.reason: str | None = None
+
+    def __call__(self, image: np.ndarray, face: FaceBox | None) -> bool:
+        if self.settings is None:
+            return True
+        report = check_frame(image, self.settings) if face is None else check_face(face, self.settings)
+        self.reason = report.reason
+        return report.passed
+
+
+def _image_face_crop(detector: FaceDetector, path: str, screen: _Screen) -> Tuple[np.ndarray | None, str | None]:
+    """Face crop of an image, or None with the reason it was skipped."""
+    image = cv2.imread(path)
+    if image is None:
+        return None, "unreadable"
+    if not screen(image, None):
+        return None, screen.reason
+    face = select_largest_face(detector.detect_faces(image))
+    if face is None:
+        return None, "no_face"
+    if not screen(image, face):
+        return None, screen.reason
+    return crop_and_resize(image, face), None
+
+
+def compute_modules_batch(
+    detector: FaceDetector,
+    config: dict,
+    paths: List[str],
+    modules=PAD_MODULES,
+    reasons: Dict[str, str] | None = None,
+) -> List[Dict[str, float] | None]:
+    """Requested PAD module scores for each path; None where no usable face is found.
+
+    Videos are streamed one at a time; image crops are collected and scored
+    ``CROP_CHUNK`` at a time by the batched texture/frequency kernels. Skipped
+    paths are recorded in ``reasons`` (``no_face``, ``unreadable`` or a
+    quality-gate reason such as ``blurry``).
+    """
+    pad = config["pad"]
+    settings = quality_settings(config)
+    results: List[Dict[str, float] | None] = [None] * len(paths)
+    crops = []
+    crop_index = []
+
+    def flush() -> None:
+        stack = np.stack(crops)
+        batch = {}
+        if "texture" in modules:
+            batch["texture"] = texture_scores(stack, pad["texture"]["lbp_points"], pad["texture"]["lbp_radius"])
+        if "freq" in modules:
+            batch["freq"] = freq_scores(stack, pad["freq"]["high_freq_ratio_threshold"])
+        for j, i in enumerate(crop_index):
+            values = {name: float(column[j]) for name, column in batch.items()}
+            # Single images carry no temporal signal.
+            for name in ("motion", "rppg"):
+                if name in modules:
+                    values[name] = 0.0
+            results[i] = values
+        crops.clear()
+        crop_index.clear()
+
+    for i, path in enumerate(paths):
+        screen = _Screen(settings)
+        if path.lower().endswith(VIDEO_EXTS):
+            source = source_from_config(path, config)
+            crops_iter = iter_face_crops(source, detector, tracker=tracker_from_config(detector, config), screen=screen)
+            results[i] = video_module_scores(crops_iter, pad, modules, fps=lambda: source.sample_fps)
+            reason = (screen.reason or "no_face") if results[i] is None else None
+        else:
+            crop, reason = _image_face_crop(detector, path, screen)
+            if crop is not None:
+                crops.append(crop)
+                crop_index.append(i)
+                if len(crops) >= CROP_CHUNK:
+                    flush()
+        if reason is not None and reasons is not None:
+            reasons[path] = reason
+
+    if crops:
+        flush()
+    return results
+
+
+def compute_modules(detector: FaceDetector, config: dict, path: str, modules=PAD_MODULES) -> Dict[str, float] | None:
+    """Compute the requested PAD module scores; None if no face is found."""
+    return compute_modules_batch(detector, config, [path], modules)[0]
+
+
+def score_components_batch(
+    detector: FaceDetector,
+    config: dict,
+    paths: List[str],
+    cache: PadScoreCache | None = None,
+    reasons: Dict[str, str] | None = None,
+) -> List[PadScores | None]:
+    """All four PAD module scores per sample, reusing cached modules.
+
+    Samples missing the same set of modules are computed together. Skipped
+    samples are recorded in ``reasons`` as in ``compute_modules_batch``, also
+    when the skip comes from the cache. Cache reads and writes are batched
+    over ``paths``.
+    """
+    reasons = {} if reasons is None else reasons
+    values: List[Dict[str, float | None] | None] = [{} for _ in paths]
+    digests: List[str | None] = [None] * len(paths)
+    if cache is not None:
+        for i, path in enumerate(paths):
+            try:
+                digests[i] = file_digest(path)
+            except OSError:
+                values[i] = None
+                reasons[path] = "unreadable"
+        cached_reasons: Dict[str, str] = {}
+        hits = cache.get_many(list({d for d in digests if d is not None}), cached_reasons)
+        for i, digest in enumerate(digests):
+            if digest in cached_reasons:
+                values[i] = None
+                reasons[paths[i]] = cached_reasons[digest]
+            elif digest is not None:
+                values[i] = dict(hits.get(digest, {}))
+
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        missing = tuple(name for name in PAD_MODULES if name not in value)
+        if missing:
+            groups.setdefault(missing, []).append(i)
+
+    for missing, indices in groups.items():
+        computed = compute_modules_batch(detector, config, [paths[i] for i in indices], missing, reasons)
+        new: Dict[str, Dict[str, float | None]] = {}
+        new_reasons: Dict[str, str] = {}
+        for i, result in zip(indices, computed):
+            # An unreadable file may be a transient failure; only outcomes of a successful read are cached.
+            if digests[i] is not None and reasons.get(paths[i]) != "unreadable":
+                new[digests[i]] = result if result is not None else {name: None for name in missing}
+                if result is None:
+                    new_reasons[digests[i]] = reasons.get(paths[i], "no_face")
+            values[i] = None if result is None else {**values[i], **result}
+        if new:
+            cache.put_many(new, new_reasons)
+    return [None if v is None else PadScores(**v) for v in values]
+
+
+def score_components(detector: FaceDetector, config: dict, path: str, cache: PadScoreCache | None = None) -> PadScores | None:
+    """All four PAD module scores for one sample, reusing cached modules."""
+    return score_components_batch(detector, config, [path], cache)[0]
+
+
+def score_sample(detector: FaceDetector, config: dict, path: str, cache: PadScoreCache | None = None) -> float | None:
+    scores = score_components(detector, config, path, cache)
+    if scores is None:
+        return None
     decision = fuse_scores(scores, config["fusion"]["weights"], config["fusion"]["decision_threshold"])
     return decision.score
 
 
+def _pad_context(config_path: str, threads: int, cache_path: str | None = None):
+    config = load_config(Path(config_path))
+    configure_runtime(config.get("runtime"), intra_op_threads=threads)
+    detector = detector_from_config(config)
+    cache = PadScoreCache(cache_path, config) if cache_path else None
+    return detector, config, cache
+
+
+def _init_pad_worker(config_path: str, threads: int, cache_path: str | None = None):
+    ctx = _pad_context(config_path, threads, cache_path)
+    if ctx[2] is not None:
+        # The worker keeps its cache for all its shards; release it when the process exits.
+        atexit.register(ctx[2].close)
+    return ctx
+
+
+# Shard row format: 1 = fused "score" (before per-module components), 2 = "components".
+SHARD_SCHEMA = 2
+
+
+def shard_params(config: dict) -> dict:
+    """Settings the PAD component rows depend on (pins resumable shard directories)."""
+    return {"modules": module_params(config), "variant": (config.get("runtime") or {}).get("variant", "fp32")}
+
+
+def _score_pad_shard(ctx, start: int, samples: List[Tuple[str, int]]) -> List[dict]:
+    detector, config, cache = ctx
+    rows = []
+    reasons: Dict[str, str] = {}
+    all_scores = score_components_batch(detector, config, [path for path, _ in samples], cache, reasons)
+    for offset, ((path, label), scores) in enumerate(zip(samples, all_scores)):
+        components = None if scores is None else [getattr(scores, name) for name in PAD_MODULES]
+        rows.append({"index": start + offset, "label": label, "components": components, "skipped": reasons.get(path)})
+    return rows
+
+
 def compute_apcer_bpcer(scores: List[float], labels: List[int], threshold: float) -> Tuple[float, float]:
     # label: 1=spoof (attack), 0=bonafide
-    apc = 0
-    bpc = 0
-    attack = 0
-    bona = 0
-
-    for s, y in zip(scores, labels):
-        if y == 1:
-            attack += 1
-            if s < threshold:
-                apc += 1
-        else:
-            bona += 1
-            if s >= threshold:
-                bpc += 1
-
-    apcer = apc / max(attack, 1)
-    bpcer = bpc / max(bona, 1)
+    bpcer, apcer = rates_at_threshold(scores, labels, threshold)
     return apcer, bpcer
 
 
 def find_eer_like(scores: List[float], labels: List[int]) -> Tuple[float, float]:
-    thresholds = [i / 100 for i in range(0, 101)]
-    best_gap = 1.0
-    best_thr = 0.5
-    best_val = 1.0
-
-    for thr in thresholds:
-        apcer, bpcer = compute_apcer_bpcer(scores, labels, thr)
-        gap = abs(apcer - bpcer)
-        if gap < best_gap:
-            best_gap = gap
-            best_thr = thr
-            best_val = (apcer + bpcer) / 2.0
-
-    return best_val, best_thr
+    return equal_error_rate(error_curve(scores, labels))
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Compute APCER/BPCER for PAD")
-    parser.add_argument("--samples", required=True, help="CSV: path,label(1=spoof,0=bonafide)")
+    parser.add_argument("--samples", required=True, help="CSV: path,label(1=spoof,0=bonafide)[,subject]")
     parser.add_argument("--config", default="configs/thresholds.yaml")
     parser.add_argument("--threshold", type=float, default=None, help="Decision threshold")
+    parser.add_argument("--apcer-targets", default="0.05,0.10", help="Comma-separated APCER points for BPCER@APCER")
+    parser.add_argument("--curve-out", default=None, help="Write threshold,bpcer,apcer CSV (DET data)")
+    parser.add_argument("--pad-cache", default=None, help="SQLite cache of per-module PAD scores (reused across runs)")
+    parser.add_argument("--components-out", default=None, help="Write per-module scores (.npz) for tune_fusion")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--out-dir", default=None, help="Directory for resumable score shards")
+    parser.add_argument("--shard-size", type=int, default=500, help="Samples per shard")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Bootstrap resamples for confidence intervals (0=off)")
+    parser.add_argument("--subject-disjoint", action="store_true", help="Resample subjects instead of samples (needs subject column)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of bootstrap intervals")
+    parser.add_argument("--metrics-out", default=None, help="Write per-stage latency histograms (Prometheus text) here")
     args = parser.parse_args()
 
     config = load_config(Path(args.config))
-    detector = FaceDetector(backend=config.get("detector", {}).get("backend", "retinaface"))
-
     samples = load_pad_samples(Path(args.samples))
-    scores = []
+    components = []
     labels = []
+    kept = []
+
+    with collect(args.metrics_out, config.get("telemetry")):
+        if args.workers > 1 or args.out_dir is not None:
+            threads = max(1, (os.cpu_count() or 1) // max(args.workers, 1))
+            with shard_dir(args.out_dir) as run_dir:
+                rows = run_sharded(
+                    samples,
+                    _score_pad_shard,
+                    _init_pad_worker,
+                    (args.config, threads, args.pad_cache),
+                    run_dir,
+                    args.shard_size,
+                    args.workers,
+                    params=shard_params(config),
+                    schema=SHARD_SCHEMA,
+                )
+        else:
+            ctx = _pad_context(args.config, 0, args.pad_cache)
+            rows = []
+            try:
+                # Same slices as the sharded path, so memory does not grow with the CSV.
+                for start in range(0, len(samples), args.shard_size):
+                    rows.extend(_score_pad_shard(ctx, start, samples[start : start + args.shard_size]))
+            finally:
+                if ctx[2] is not None:
+                    ctx[2].close()
 
-    for path, label in samples:
-        score = score_sample(detector, config, path)
-        if score is None:
+    skipped: Dict[str, int] = {}
+    for row in rows:
+        if row["components"] is None:
+            reason = row.get("skipped") or "no_face"
+            skipped[reason] = skipped.get(reason, 0) + 1
             continue
-        scores.append(score)
-        labels.append(label)
+        components.append(row["components"])
+        labels.append(row["label"])
+        kept.append(row["index"])
+
+    if args.components_out and components:
+        np.savez_compressed(
+            args.components_out,
+            components=np.asarray(components, dtype=np.float32),
+            labels=np.asarray(labels, dtype=np.int8),
+            paths=np.asarray([samples[i][0] for i in kept]),
+            modules=np.asarray(PAD_MODULES),
+        )
+
+    weights = config["fusion"]["weights"]
+    w = np.array([weights.get(name, 0.0) for name in PAD_MODULES], dtype=np.float64)
+    scores = (np.asarray(components, dtype=np.float64).reshape(-1, len(PAD_MODULES)) @ w).tolist()
 
     if not scores:
         print("No valid samples processed")
@@ -144,13 +438,38 @@ def main() -> int:
     if threshold is None:
         threshold = config["fusion"]["decision_threshold"]
 
-    apcer, bpcer = compute_apcer_bpcer(scores, labels, threshold)
-    eer_like, eer_thr = find_eer_like(scores, labels)
+    apcer_targets = [float(x) for x in args.apcer_targets.split(",") if x]
+    curve = error_curve(scores, labels)
+    bpcer, apcer = curve_rates_at(curve, threshold)
+    eer_like, eer_thr = equal_error_rate(curve)
+
+    intervals = {}
+    if args.bootstrap:
+        groups = None
+        if args.subject_disjoint:
+            subjects = load_sample_subjects(Path(args.samples))
+            if subjects is None:
+                print("--subject-disjoint needs a subject column in the samples CSV")
+                return 1
+            groups = [subjects[i] for i in kept]
+        intervals = bootstrap_intervals(
+            scores, labels, threshold,
+            n_resamples=args.bootstrap, groups=groups, fnr_targets=apcer_targets, confidence=args.confidence,
+        )
 
     print(f"Samples: {len(scores)}")
-    print(f"APCER@{threshold:.2f}: {apcer:.4f}")
-    print(f"BPCER@{threshold:.2f}: {bpcer:.4f}")
-    print(f"EER-like: {eer_like:.4f} at threshold {eer_thr:.2f}")
+    if skipped:
+        print(f"Skipped: {sum(skipped.values())} ({', '.join(f'{k}={v}' for k, v in sorted(skipped.items()))})")
+    print(f"APCER@{threshold:.2f}: {apcer:.4f}{format_interval(intervals.get('fnr'))}")
+    print(f"BPCER@{threshold:.2f}: {bpcer:.4f}{format_interval(intervals.get('fpr'))}")
+    print(f"EER-like: {eer_like:.4f} at threshold {eer_thr:.4f}{format_interval(intervals.get('eer'))}")
+    if curve.n_pos and curve.n_neg:
+        for target in apcer_targets:
+            bp, thr = fpr_at_fnr(curve, target)
+            ci = intervals.get(f"fpr@fnr={target:g}")
+            print(f"BPCER@APCER={target:g}: {bp:.4f} at threshold {thr:.4f}{format_interval(ci)}")
+    if args.curve_out:
+        write_curve_csv(curve, args.curve_out, fpr_name="bpcer", fnr_name="apcer")
     return 0
 
 
@@ -1,6 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Sequence, Tuple
+
+from .telemetry import timed
+
+# Module order used for component vectors (eval_pad, tune_fusion).
+PAD_MODULES = ("texture", "freq", "motion", "rppg")
 
 
 @dataclass
@@ -15,6 +21,10 @@ class PadScores:
 class PadDecision:
     score: float
     is_spoof: bool
+    # Modules that were actually computed, in the order they ran.
+    stages: Tuple[str, ...] = PAD_MODULES
+    # Score of each computed module.
+    modules: Dict[str, float] = field(default_factory=dict)
 
 
 def fuse_scores(scores: PadScores, weights: dict, decision_threshold: float) -> PadDecision:
@@ -25,4 +35,72 @@ def fuse_scores(scores: PadScores, weights: dict, decision_threshold: float) ->
         + scores.rppg * weights.get("rppg", 0.0)
     )
     is_spoof = total >= decision_threshold
-    return PadDecision(score=total, is_spoof=is_spoof)
+    return PadDecision(score=total, is_spoof=is_spoof, modules=asdict(scores))
+
+
+def fuse_cascade(
+    stages: Sequence[Tuple[str, Callable[[], float]]],
+    weights: dict,
+    decision_threshold: float,
+    margin: float = 0.0,
+    known: Dict[str, float] | None = None,
+) -> PadDecision:
+    """Weighted-sum fusion that stops computing modules once the decision is settled.
+
+    ``stages`` are (module, scorer) pairs in run order; every module score is
+    in [0, 1] and weights are non-negative. ``known`` holds module scores
+    that need no computation (e.g. motion/rPPG of a still image); they are
+    fused up front. After each stage the fused score is bounded using the
+    weights of the modules not yet run, and the cascade exits when the bound
+    lies entirely on one side of the threshold (same decision as full
+    fusion). With ``margin`` > 0 it also exits when the score so far,
+    normalised by the weight seen, is more than ``margin`` away from the
+    threshold. The reported score is the weighted sum of the modules that
+    were scored, i.e. full fusion with skipped modules counted as 0: on the
+    same scale as ``fuse_scores`` and never above it.
+    """
+    known = known or {}
+    modules: Dict[str, float] = dict(known)
+    partial = sum(weights.get(name, 0.0) * score for name, score in known.items())
+    remaining = sum(weights.get(name, 0.0) for name, _ in stages)
+    total_weight = remaining + sum(weights.get(name, 0.0) for name in known)
+    ran = []
+    for i, (name, scorer) in enumerate(stages):
+        w = weights.get(name, 0.0)
+        if w == 0.0:
+            continue
+        modules[name] = scorer()
+        partial += w * modules[name]
+        remaining -= w
+        ran.append(name)
+        if i == len(stages) - 1:
+            break
+        # Exact: the remaining modules cannot move the score across the threshold.
+        settled_spoof = partial >= decision_threshold
+        settled_bona = partial + remaining < decision_threshold
+        if margin > 0:
+            estimate = partial / (total_weight - remaining) * total_weight
+            settled_spoof = settled_spoof or estimate >= decision_threshold + margin
+            settled_bona = settled_bona or estimate < decision_threshold - margin
+        if settled_spoof or settled_bona:
+            return PadDecision(score=partial, is_spoof=settled_spoof, stages=tuple(ran), modules=modules)
+    return PadDecision(score=partial, is_spoof=partial >= decision_threshold, stages=tuple(ran), modules=modules)
+
+
+@timed("pad")
+def decide(scorers: Dict[str, Callable[[], float]], config: dict, known: Dict[str, float] | None = None) -> PadDecision:
+    """PAD decision from lazy per-module scorers using the ``fusion`` and ``pad.cascade`` config.
+
+    ``known`` gives modules whose score is fixed (not computed). With the
+    cascade enabled, the other modules run in ``pad.cascade.order`` and may
+    be skipped; otherwise all modules are computed and fused.
+    """
+    known = known or {}
+    fusion = config["fusion"]
+    cascade = config.get("pad", {}).get("cascade") or {}
+    if cascade.get("enabled", False):
+        order = [name for name in cascade.get("order", PAD_MODULES) if name in scorers and name not in known]
+        stages = [(name, scorers[name]) for name in order]
+        return fuse_cascade(stages, fusion["weights"], fusion["decision_threshold"], cascade.get("margin", 0.0), known)
+    scores = PadScores(**{name: known[name] if name in known else scorers[name]() for name in PAD_MODULES})
+    return fuse_scores(scores, fusion["weights"], fusion["decision_threshold"])
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from .embed_store import DTYPES, EmbeddingStore, as_float32
+
+# 1:N gallery of enrolled face embeddings for duplicate-identity screening.
+#
+# Rows live in an ``embed_store.EmbeddingStore`` directory (vectors, ids,
+# detector score, quality) with two gallery columns:
+#   live.bin      (capacity,) uint8, 0 = deleted (tombstone)
+#   assign.bin    (capacity,) int32 IVF list per row (-1 = none)
+# plus ivf.npz, the IVF centroids and rows grouped by list at build time.
+# Rows are append-only; deletes only clear ``live``. Exact search scans the
+# matrix block by block; the IVF index scans only the lists nearest to the
+# query (plus rows added since the last build).
+
+GALLERY_COLUMNS = {"live": ("uint8", 0), "assign": ("int32", -1)}
+
+
+def _normalise(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None]
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-9)
+
+
+def _merge_topk(best_s: np.ndarray, best_r: np.ndarray, scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge (Q, m) candidate scores/rows into the running (Q, k) best, sorted descending."""
+    all_s = np.concatenate([best_s, scores], axis=1)
+    all_r = np.concatenate([best_r, np.broadcast_to(rows, scores.shape)], axis=1)
+    if all_s.shape[1] > k:
+        part = np.argpartition(-all_s, k - 1, axis=1)[:, :k]
+        all_s = np.take_along_axis(all_s, part, axis=1)
+        all_r = np.take_along_axis(all_r, part, axis=1)
+    order = np.argsort(-all_s, axis=1, kind="stable")
+    return np.take_along_axis(all_s, order, axis=1), np.take_along_axis(all_r, order, axis=1)
+
+
+class Gallery:
+    """Memory-mapped embedding gallery with exact and IVF top-k cosine search.
+
+    Embeddings are L2-normalised on add; ``dtype`` trades memory for
+    precision (int8 stores a per-row scale). ``ids`` are int64 customer or
+    enrolment ids; deleting an id tombstones every row enrolled under it.
+    ``model_version`` pins the gallery to one ArcFace model, as in
+    ``EmbeddingStore``.
+    """
+
+    def __init__(
+        self, path: str | Path, dim: int = 512, dtype: str = "float16", model_version: str | None = None, readonly: bool = False
+    ):
+        self.store = EmbeddingStore(path, dim, dtype, model_version, GALLERY_COLUMNS, readonly)
+        self.path = self.store.path
+        self.readonly = readonly
+        self.dim = self.store.dim
+        self.dtype = self.store.dtype
+        self._id_order: np.ndarray | None = None
+        self._ivf = None
+        ivf_path = self.path / "ivf.npz"
+        if ivf_path.exists():
+            with np.load(ivf_path) as data:
+                self._ivf = {name: data[name] for name in data.files}
+
+    def flush(self) -> None:
+        self.store.flush()
+
+    @property
+    def count(self) -> int:
+        """Rows ever added, including deleted ones."""
+        return self.store.count
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.store.column("live")))
+
+    # -- writes ----------------------------------------------------------
+
+    def _nearest_list(self, emb: np.ndarray) -> np.ndarray:
+        if self._ivf is None:
+            return np.full(len(emb), -1, dtype=np.int32)
+        return np.argmax(emb @ self._ivf["centroids"].T, axis=1).astype(np.int32)
+
+    def add(
+        self,
+        ids: Sequence[int],
+        embeddings: np.ndarray,
+        det_scores: Sequence[float] | None = None,
+        quality: Sequence[float] | None = None,
+    ) -> np.ndarray:
+        """Append embeddings under ``ids``; returns their row numbers."""
+        if self.readonly:
+            raise PermissionError("gallery opened read-only")
+        emb = _normalise(embeddings)
+        rows = self.store.append(ids, emb, det_score=det_scores, quality=quality, live=1, assign=self._nearest_list(emb))
+        self._id_order = None
+        return rows
+
+    def rows_for(self, ids: Sequence[int]) -> np.ndarray:
+        """Live rows enrolled under any of ``ids``."""
+        all_ids = self.store.ids
+        if self._id_order is None:
+            self._id_order = np.argsort(all_ids, kind="stable")
+        sorted_ids = all_ids[self._id_order]
+        wanted = np.unique(np.asarray(ids, dtype=np.int64))
+        lo = np.searchsorted(sorted_ids, wanted, side="left")
+        hi = np.searchsorted(sorted_ids, wanted, side="right")
+        rows = np.concatenate([self._id_order[a:b] for a, b in zip(lo, hi)]) if len(wanted) else np.zeros(0, dtype=np.int64)
+        return rows[self.store.column("live")[rows] == 1] if len(rows) else rows
+
+    def delete(self, ids: Sequence[int]) -> int:
+        """Tombstone every live row of ``ids``; returns the number of rows deleted."""
+        if self.readonly:
+            raise PermissionError("gallery opened read-only")
+        rows = self.rows_for(ids)
+        if len(rows):
+            self.store.column("live")[rows] = 0
+            self.flush()
+        return len(rows)
+
+    # -- search ----------------------------------------------------------
+
+    def _scores(self, rows: slice | np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(len(rows), Q) cosine scores of stored rows against normalised queries."""
+        block = as_float32(self.store.column("vectors")[rows])
+        scores = block @ queries.T
+        if self.dtype == "int8":
+            scores *= self.store.column("scales")[rows][:, None]
+        dead = self.store.column("live")[rows] == 0
+        scores[dead] = -np.inf
+        return scores
+
+    def search_exact(self, queries: np.ndarray, k: int = 10, block_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k by blocked matrix multiply: (scores, ids), both (Q, k); id -1 pads short results."""
+        q = _normalise(queries)
+        best_s = np.full((len(q), 0), -np.inf, dtype=np.float32)
+        best_r = np.zeros((len(q), 0), dtype=np.int64)
+        for start in range(0, self.count, block_rows):
+            rows = slice(start, min(start + block_rows, self.count))
+            scores = self._scores(rows, q).T
+            best_s, best_r = _merge_topk(best_s, best_r, scores, np.arange(rows.start, rows.stop)[None], k)
+        return self._finish(best_s, best_r, k)
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = 16, block_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k search: IVF over the ``nprobe`` nearest lists if an index is built, else exact."""
+        if self._ivf is None:
+            return self.search_exact(queries, k, block_rows)
+        q = _normalise(queries)
+        ivf = self._ivf
+        centroids, order, offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+        indexed = int(ivf["indexed"])
+        nprobe = min(nprobe, len(centroids))
+        probes = np.argpartition(-(q @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        # Rows added since the build are not in ``order``; scan the ones assigned to a probed list.
+        tail_assign = self.store.column("assign")[indexed:]
+
+        out_s = np.full((len(q), k), -np.inf, dtype=np.float32)
+        out_r = np.full((len(q), k), -1, dtype=np.int64)
+        for i in range(len(q)):
+            lists = np.sort(probes[i])
+            rows = np.concatenate([order[offsets[c] : offsets[c + 1]] for c in lists])
+            if len(tail_assign):
+                rows = np.concatenate([rows, indexed + np.flatnonzero(np.isin(tail_assign, lists))])
+            rows = np.sort(rows)
+            best_s = np.full((1, 0), -np.inf, dtype=np.float32)
+            best_r = np.zeros((1, 0), dtype=np.int64)
+            for start in range(0, len(rows), block_rows):
+                chunk = rows[start : start + block_rows]
+                best_s, best_r = _merge_topk(best_s, best_r, self._scores(chunk, q[i : i + 1]).T, chunk[None], k)
+            out_s[i, : best_s.shape[1]] = best_s[0]
+            out_r[i, : best_r.shape[1]] = best_r[0]
+        return self._finish(out_s, out_r, k)
+
+    def _finish(self, best_s: np.ndarray, best_r: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.full((best_s.shape[0], k), -np.inf, dtype=np.float32)
+        ids = np.full((best_s.shape[0], k), -1, dtype=np.int64)
+        m = min(k, best_s.shape[1])
+        scores[:, :m] = best_s[:, :m]
+        valid = np.isfinite(scores[:, :m])
+        found = np.where(valid, best_r[:, :m], 0)
+        ids[:, :m] = np.where(valid, self.store.ids[found] if self.count else -1, -1)
+        return scores, ids
+
+    # -- IVF index -------------------------------------------------------
+
+    def build_index(
+        self, nlist: int | None = None, iterations: int = 10, sample_size: int = 100_000, block_rows: int = 65536, seed: int = 0
+    ) -> None:
+        """Train spherical k-means centroids on a sample and assign every row to its nearest list.
+
+        Default ``nlist`` is about 4*sqrt(N). Re-run after many additions to
+        fold newly added rows into the sorted lists.
+        """
+        if self.readonly:
+            raise PermissionError("gallery opened read-only")
+        n = self.count
+        if n == 0:
+            raise ValueError("cannot index an empty gallery")
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, size=min(n, max(sample_size, nlist)), replace=False))
+        sample = self._decode(sample_rows)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalise(sums)
+
+        assign = self.store.column("assign")
+        for start in range(0, n, block_rows):
+            rows = slice(start, min(start + block_rows, n))
+            assign[rows] = np.argmax(self._decode(rows) @ centroids.T, axis=1)
+        order = np.argsort(assign[:n], kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assign[:n][order], np.arange(nlist + 1)).astype(np.int64)
+        self._ivf = {"centroids": centroids, "order": order, "offsets": offsets, "indexed": np.int64(n)}
+        tmp = self.path / "ivf.tmp.npz"
+        np.savez(tmp, **self._ivf)
+        os.replace(tmp, self.path / "ivf.npz")
+        self.flush()
+
+    def _decode(self, rows: slice | np.ndarray) -> np.ndarray:
+        return _normalise(self.store.vectors(rows))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark gallery search on random embeddings")
+    parser.add_argument("--path", required=True, help="Gallery directory (created if missing)")
+    parser.add_argument("--size", type=int, default=100_000, help="Random embeddings to enrol if the gallery is empty")
+    parser.add_argument("--dtype", default="float16", choices=DTYPES)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N); 0 = exact only)")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    gallery = Gallery(args.path, dtype=args.dtype)
+    rng = np.random.default_rng(0)
+    if gallery.count == 0:
+        for start in range(0, args.size, 100_000):
+            n = min(100_000, args.size - start)
+            gallery.add(np.arange(start, start + n), rng.standard_normal((n, gallery.dim)).astype(np.float32))
+    queries = gallery._decode(rng.choice(gallery.count, size=args.queries)) + 0.01 * rng.standard_normal((args.queries, gallery.dim))
+
+    t = time.perf_counter()
+    exact_s, exact_ids = gallery.search_exact(queries, args.k)
+    exact_ms = (time.perf_counter() - t) * 1000 / args.queries
+    print(f"Gallery: {len(gallery)} live rows ({gallery.dtype}); exact: {exact_ms:.2f} ms/query")
+    if args.nlist != 0:
+        t = time.perf_counter()
+        gallery.build_index(args.nlist)
+        print(f"IVF build: {time.perf_counter() - t:.1f} s")
+        t = time.perf_counter()
+        _, ivf_ids = gallery.search(queries, args.k, args.nprobe)
+        ivf_ms = (time.perf_counter() - t) * 1000 / args.queries
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(exact_ids, ivf_ids)])
+        print(f"IVF nprobe={args.nprobe}: {ivf_ms:.2f} ms/query, recall@{args.k}={recall:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
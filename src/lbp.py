@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import argparse
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+
+# Uniform LBP (skimage ``local_binary_pattern(..., method="uniform")``) for
+# whole stacks of grayscale crops. Each of the P circle samples is one shifted
+# (and, off-grid, bilinearly interpolated) view of the zero-padded stack; the
+# P comparison bits form a code that a precomputed 2**P-entry table maps to
+# the uniform label. The arithmetic follows skimage operation by operation
+# (float64, same interpolation order, cval 0 outside the image), so labels and
+# histograms are bit-identical; ``python -m src.lbp`` checks this.
+
+MAX_LUT_POINTS = 16
+
+
+def _sample_offsets(points: int, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    angles = 2 * np.pi * np.arange(points, dtype=np.float64) / points
+    rp = np.round(-radius * np.sin(angles), 5)
+    cp = np.round(radius * np.cos(angles), 5)
+    return rp, cp
+
+
+@lru_cache(maxsize=None)
+def uniform_lut(points: int) -> np.ndarray:
+    """Uniform label of every P-bit code (bit i = sample i >= centre).
+
+    As in skimage, a code is uniform when it has at most two 0/1 changes
+    between consecutive samples 0..P-1 (no wrap-around); its label is then
+    its number of set bits, otherwise ``P + 1``.
+    """
+    codes = np.arange(1 << points)
+    bits = (codes[:, None] >> np.arange(points)) & 1
+    changes = (bits[:, 1:] != bits[:, :-1]).sum(axis=1)
+    return np.where(changes <= 2, bits.sum(axis=1), points + 1).astype(np.uint8)
+
+
+def supports(points: int, radius: float) -> bool:
+    """True if the LUT kernel handles this configuration."""
+    return 0 < points <= MAX_LUT_POINTS and radius > 0
+
+
+def _shifted(padded: np.ndarray, pad: int, dr: int, dc: int, h: int, w: int) -> np.ndarray:
+    return padded[:, pad + dr : pad + dr + h, pad + dc : pad + dc + w]
+
+
+def _lbp_codes(gray: np.ndarray, points: int, radius: float) -> np.ndarray:
+    n, h, w = gray.shape
+    pad = int(np.ceil(radius)) + 1
+    padded = np.zeros((n, h + 2 * pad, w + 2 * pad), dtype=np.uint8 if gray.dtype == np.uint8 else np.float64)
+    padded[:, pad : pad + h, pad : pad + w] = gray
+    padded_f = None
+    center = padded[:, pad : pad + h, pad : pad + w]
+    center_f = None
+    rows = np.arange(h, dtype=np.float64)
+    cols = np.arange(w, dtype=np.float64)
+
+    code = np.zeros((n, h, w), dtype=np.uint32)
+    for i, (rp, cp) in enumerate(zip(*_sample_offsets(points, radius))):
+        r = rows + rp
+        c = cols + cp
+        minr, maxr = np.floor(r), np.ceil(r)
+        minc, maxc = np.floor(c), np.ceil(c)
+        # Offsets are the same for every row/column, so each corner is a slice.
+        r0, r1 = int(minr[0]), int(maxr[0])
+        c0, c1 = int(minc[0]), int(maxc[0])
+        if r0 == r1 and c0 == c1:
+            # On-grid sample: interpolation returns the pixel itself.
+            bit = _shifted(padded, pad, r0, c0, h, w) >= center
+        else:
+            if padded_f is None:
+                padded_f = padded.astype(np.float64)
+                center_f = padded_f[:, pad : pad + h, pad : pad + w]
+            dr = (r - minr)[:, None]
+            dc = (c - minc)[None, :]
+            top = (1 - dc) * _shifted(padded_f, pad, r0, c0, h, w) + dc * _shifted(padded_f, pad, r0, c1, h, w)
+            bottom = (1 - dc) * _shifted(padded_f, pad, r1, c0, h, w) + dc * _shifted(padded_f, pad, r1, c1, h, w)
+            bit = (1 - dr) * top + dr * bottom >= center_f
+        code |= bit.astype(np.uint32) << i
+    return code
+
+
+def uniform_lbp_stack(gray: np.ndarray, points: int = 8, radius: float = 1, chunk: int = 4) -> np.ndarray:
+    """Uniform LBP labels of an (N, H, W) grayscale stack, same values as skimage.
+
+    Crops are processed ``chunk`` at a time so the float64 temporaries stay in cache.
+    """
+    gray = np.asarray(gray)
+    lut = uniform_lut(points)
+    out = np.empty(gray.shape, dtype=np.uint8)
+    for start in range(0, len(gray), chunk):
+        out[start : start + chunk] = lut[_lbp_codes(gray[start : start + chunk], points, radius)]
+    return out
+
+
+def uniform_lbp_hist(gray: np.ndarray, points: int = 8, radius: float = 1) -> np.ndarray:
+    """(N, P + 2) uniform LBP histograms of an (N, H, W) grayscale stack."""
+    n_bins = points + 2
+    if supports(points, radius):
+        labels = uniform_lbp_stack(gray, points, radius).reshape(len(gray), -1).astype(np.int64)
+    else:
+        from skimage.feature import local_binary_pattern
+
+        labels = np.stack([local_binary_pattern(g, points, radius, method="uniform") for g in gray])
+        labels = labels.reshape(len(gray), -1).astype(np.int64)
+    # Offset each crop's labels into its own bin range so one bincount builds every histogram.
+    offsets = (np.arange(len(labels)) * n_bins)[:, None]
+    hist = np.bincount((labels + offsets).ravel(), minlength=len(labels) * n_bins)
+    return hist.reshape(len(labels), n_bins)
+
+
+def _self_check(configs: List[Tuple[int, float]], n: int, size: int, seed: int) -> int:
+    from skimage.feature import local_binary_pattern
+
+    rng = np.random.default_rng(seed)
+    stacks = [
+        rng.integers(0, 256, (n, size, size), dtype=np.uint8),
+        # Few grey levels: many samples equal their centre.
+        (rng.integers(0, 4, (n, size, size)) * 64).astype(np.uint8),
+        np.full((n, size, size), 128, dtype=np.uint8),
+    ]
+    failures = 0
+    for points, radius in configs:
+        for stack in stacks:
+            ours = uniform_lbp_stack(stack, points, radius)
+            ref = np.stack([local_binary_pattern(g, points, radius, method="uniform") for g in stack])
+            mismatched = int(np.count_nonzero(ours != ref))
+            failures += mismatched > 0
+            print(f"P={points} R={radius:g} stack={stack.shape}: {mismatched} mismatched labels")
+    print("OK" if failures == 0 else f"FAILED ({failures})")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the LUT LBP kernel against skimage")
+    parser.add_argument("--configs", default="8:1,8:2,16:2,4:1", help="Comma-separated P:R pairs")
+    parser.add_argument("--n", type=int, default=16, help="Crops per stack")
+    parser.add_argument("--size", type=int, default=112, help="Crop side length")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    configs = [(int(p), float(r)) for p, r in (item.split(":") for item in args.configs.split(",") if item)]
+    return _self_check(configs, args.n, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator, List, Sequence, Tuple
+
 import numpy as np
 
-from .embed import FaceEmbedding
+if TYPE_CHECKING:
+    from .embed import FaceEmbedding
 
 
 def cosine_similarity(a: FaceEmbedding, b: FaceEmbedding) -> float:
@@ -10,3 +14,106 @@ def cosine_similarity(a: FaceEmbedding, b: FaceEmbedding) -> float:
     vb = b.vector
     denom = (np.linalg.norm(va) * np.linalg.norm(vb)) + 1e-9
     return float(np.dot(va, vb) / denom)
+
+
+def pairwise_cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity of two (N, D) embedding arrays."""
+    num = np.einsum("ij,ij->i", a, b)
+    denom = (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)) + 1e-9
+    return num / denom
+
+
+@dataclass
+class ScoreDistributions:
+    """Genuine/impostor scores from an all-pairs comparison.
+
+    With ``edges`` set, ``genuine`` and ``impostor`` are histogram counts over
+    those bin edges instead of raw score arrays.
+    """
+
+    genuine: np.ndarray
+    impostor: np.ndarray
+    edges: np.ndarray | None = None
+
+
+def block_size_for(max_block_bytes: int) -> int:
+    """Rows per side of a square score block that fits in ``max_block_bytes``.
+
+    Budget covers the float32 score block, the genuine mask and one temporary.
+    """
+    per_cell = 4 + 1 + 4
+    side = int(np.sqrt(max(max_block_bytes, 1) / per_cell))
+    return max(side, 1)
+
+
+def iter_score_blocks(
+    embeddings: np.ndarray, max_block_bytes: int = 256 << 20
+) -> Iterator[Tuple[slice, slice, np.ndarray]]:
+    """Yield (rows, cols, scores) for the upper triangle of ``E @ E.T`` block by block.
+
+    ``embeddings`` must be L2-normalised. Diagonal blocks are yielded whole;
+    callers keep only entries above the diagonal.
+    """
+    emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n = emb.shape[0]
+    step = block_size_for(max_block_bytes)
+    for i in range(0, n, step):
+        rows = slice(i, min(i + step, n))
+        for j in range(i, n, step):
+            cols = slice(j, min(j + step, n))
+            yield rows, cols, emb[rows] @ emb[cols].T
+
+
+def all_pairs_distributions(
+    embeddings: np.ndarray,
+    identities: Sequence,
+    max_block_bytes: int = 256 << 20,
+    bins: int | None = None,
+) -> ScoreDistributions:
+    """Score every unordered pair of ``embeddings`` and split by identity.
+
+    Only one block of the similarity matrix is held at a time. Pass ``bins``
+    to accumulate fixed-width histograms over [-1, 1] instead of raw scores,
+    which keeps memory constant for very large impostor sets.
+    """
+    _, codes = np.unique(np.asarray(identities), return_inverse=True)
+    codes = codes.ravel()
+
+    edges = None
+    if bins is not None:
+        edges = np.linspace(-1.0, 1.0, bins + 1)
+        gen_hist = np.zeros(bins, dtype=np.int64)
+        imp_hist = np.zeros(bins, dtype=np.int64)
+    else:
+        gen_parts: List[np.ndarray] = []
+        imp_parts: List[np.ndarray] = []
+
+    for rows, cols, block in iter_score_blocks(embeddings, max_block_bytes):
+        same = codes[rows, None] == codes[None, cols]
+        if rows.start == cols.start:
+            upper = np.triu(np.ones(block.shape, dtype=bool), k=1)
+            gen = block[same & upper]
+            imp = block[~same & upper]
+        else:
+            gen = block[same]
+            imp = block[~same]
+
+        if edges is not None:
+            gen_hist += _bin_counts(gen, bins)
+            imp_hist += _bin_counts(imp, bins)
+        else:
+            gen_parts.append(gen)
+            imp_parts.append(imp)
+
+    if edges is not None:
+        return ScoreDistributions(genuine=gen_hist, impostor=imp_hist, edges=edges)
+    return ScoreDistributions(
+        genuine=np.concatenate(gen_parts) if gen_parts else np.zeros(0, dtype=np.float32),
+        impostor=np.concatenate(imp_parts) if imp_parts else np.zeros(0, dtype=np.float32),
+    )
+
+
+def _bin_counts(scores: np.ndarray, bins: int) -> np.ndarray:
+    idx = ((scores.astype(np.float64) + 1.0) * (bins / 2.0)).astype(np.int64)
+    np.clip(idx, 0, bins - 1, out=idx)
+    return np.bincount(idx, minlength=bins)
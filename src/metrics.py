@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+import numpy as np
+
+# Shared error-rate computation for verification (FAR/FRR) and PAD
+# (APCER/BPCER). Both use the same convention: a label-1 sample is an error
+# when its score is below the threshold, a label-0 sample when it is at or
+# above it. So FRR = APCER = fnr and FAR = BPCER = fpr.
+
+
+@dataclass
+class ErrorCurve:
+    thresholds: np.ndarray  # ascending
+    fnr: np.ndarray  # fraction of label-1 scores < threshold
+    fpr: np.ndarray  # fraction of label-0 scores >= threshold
+    n_pos: int
+    n_neg: int
+
+
+def _as_arrays(scores: Sequence[float], labels: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    s = np.asarray(scores).ravel()
+    if not np.issubdtype(s.dtype, np.floating):
+        s = s.astype(np.float64)
+    y = np.asarray(labels).ravel() == 1
+    return s, y
+
+
+def error_curve(scores: Sequence[float], labels: Sequence[int]) -> ErrorCurve:
+    """Error rates at every distinct score (plus +inf), from one sort."""
+    s, y = _as_arrays(scores, labels)
+    n_pos = int(np.count_nonzero(y))
+    n_neg = len(y) - n_pos
+
+    # A plain value sort is much cheaper than argsort; label counts below each
+    # distinct score are recovered by bucketing the smaller class only.
+    ordered = np.sort(s)
+    first = np.concatenate([[0], np.flatnonzero(ordered[1:] != ordered[:-1]) + 1])
+    thresholds = ordered[first]
+    below = np.append(first, len(ordered))
+
+    minority = y if n_pos <= n_neg else ~y
+    buckets = np.searchsorted(thresholds, np.sort(s[minority]))
+    cum_minority = np.concatenate([[0], np.cumsum(np.bincount(buckets, minlength=len(thresholds)))])
+    pos_below = cum_minority if n_pos <= n_neg else below - cum_minority
+
+    thresholds = np.append(thresholds, np.inf)
+    fnr = pos_below / max(n_pos, 1)
+    fpr = (n_neg - (below - pos_below)) / max(n_neg, 1)
+    return ErrorCurve(thresholds=thresholds, fnr=fnr, fpr=fpr, n_pos=n_pos, n_neg=n_neg)
+
+
+def curve_from_histograms(pos_counts: np.ndarray, neg_counts: np.ndarray, edges: np.ndarray) -> ErrorCurve:
+    """Error rates at every bin edge from label-1/label-0 histogram counts."""
+    cum_pos = np.concatenate([[0], np.cumsum(pos_counts)])
+    cum_neg = np.concatenate([[0], np.cumsum(neg_counts)])
+    n_pos = int(cum_pos[-1])
+    n_neg = int(cum_neg[-1])
+    fnr = cum_pos / max(n_pos, 1)
+    fpr = (n_neg - cum_neg) / max(n_neg, 1)
+    return ErrorCurve(thresholds=np.asarray(edges, dtype=np.float64), fnr=fnr, fpr=fpr, n_pos=n_pos, n_neg=n_neg)
+
+
+def rates_at_threshold(scores: Sequence[float], labels: Sequence[int], threshold: float) -> Tuple[float, float]:
+    """Return (fpr, fnr) at one threshold."""
+    s, y = _as_arrays(scores, labels)
+    n_pos = int(y.sum())
+    n_neg = len(y) - n_pos
+    fn = int(np.count_nonzero(s[y] < threshold))
+    fp = int(np.count_nonzero(s[~y] >= threshold))
+    return fp / max(n_neg, 1), fn / max(n_pos, 1)
+
+
+def curve_rates_at(curve: ErrorCurve, threshold: float) -> Tuple[float, float]:
+    """Return (fpr, fnr) at ``threshold``, rounded up to the next curve threshold."""
+    k = min(int(np.searchsorted(curve.thresholds, threshold, side="left")), len(curve.thresholds) - 1)
+    return float(curve.fpr[k]), float(curve.fnr[k])
+
+
+def equal_error_rate(curve: ErrorCurve) -> Tuple[float, float]:
+    """Return (eer, threshold) at the threshold where |fpr - fnr| is smallest."""
+    k = int(np.argmin(np.abs(curve.fpr - curve.fnr)))
+    return float((curve.fpr[k] + curve.fnr[k]) / 2.0), float(curve.thresholds[k])
+
+
+def fnr_at_fpr(curve: ErrorCurve, target: float) -> Tuple[float, float]:
+    """Lowest fnr with fpr <= target; returns (fnr, threshold). TAR = 1 - fnr."""
+    k = int(np.argmax(curve.fpr <= target))
+    return float(curve.fnr[k]), float(curve.thresholds[k])
+
+
+def fpr_at_fnr(curve: ErrorCurve, target: float) -> Tuple[float, float]:
+    """Lowest fpr with fnr <= target; returns (fpr, threshold), e.g. BPCER@APCER."""
+    k = int(np.flatnonzero(curve.fnr <= target)[-1])
+    return float(curve.fpr[k]), float(curve.thresholds[k])
+
+
+def roc_points(curve: ErrorCurve) -> Tuple[np.ndarray, np.ndarray]:
+    """ROC as (fpr, tpr), ordered by increasing fpr."""
+    return curve.fpr[::-1], 1.0 - curve.fnr[::-1]
+
+
+def det_points(curve: ErrorCurve) -> Tuple[np.ndarray, np.ndarray]:
+    """DET as (fpr, fnr), ordered by increasing fpr."""
+    return curve.fpr[::-1], curve.fnr[::-1]
+
+
+def write_curve_csv(curve: ErrorCurve, path: str, fpr_name: str = "fpr", fnr_name: str = "fnr") -> None:
+    """Dump the full curve as threshold,fpr,fnr rows (ROC/DET source data)."""
+    table = np.column_stack([curve.thresholds, curve.fpr, curve.fnr])
+    np.savetxt(path, table, delimiter=",", header=f"threshold,{fpr_name},{fnr_name}", comments="", fmt="%.8g")
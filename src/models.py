@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import functools
+import glob
+import os.path as osp
+import threading
+from typing import Dict, Sequence, Tuple
+
+from .cache import file_digest
+
+# insightface (which drags in matplotlib, albumentations, scipy, ...) and
+# onnxruntime take seconds to import, so they are imported inside the
+# functions that build sessions. Importing this module, or anything that only
+# references get_model, stays cheap for Haar/MTCNN runs and metric scripts.
+
+# Known sub-model files per InsightFace pack, so a task can be loaded without
+# opening a session for every ONNX file in the pack (genderage, landmarks, ...).
+PACK_FILES: Dict[str, Dict[str, str]] = {
+    "buffalo_l": {"detection": "det_10g.onnx", "recognition": "w600k_r50.onnx"},
+    "buffalo_m": {"detection": "det_2.5g.onnx", "recognition": "w600k_r50.onnx"},
+    "buffalo_s": {"detection": "det_500m.onnx", "recognition": "w600k_mbf.onnx"},
+    "buffalo_sc": {"detection": "det_500m.onnx", "recognition": "w600k_mbf.onnx"},
+}
+
+TASKS = ("detection", "recognition")
+
+# Model artefacts written next to the original file by download_models:
+# "optimized" is the graph ORT produces offline (loaded with optimisation off,
+# so sessions start faster); "int8" is a dynamically quantised copy.
+VARIANT_SUFFIXES = {"fp32": ".onnx", "optimized": ".opt.onnx", "int8": ".int8.onnx"}
+GRAPH_OPTIMIZATION = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+_MODELS: Dict[Tuple[str, str, int, str], object] = {}
+_LOCK = threading.Lock()
+_SESSION = {"intra_op": 0, "inter_op": 0, "graph_optimization": "all", "variant": "fp32", "providers": None}
+
+
+def model_dir(model_name: str = "buffalo_l", root: str = "~/.insightface") -> str:
+    """Return the local directory of a model pack, downloading it if missing."""
+    from insightface.utils import ensure_available
+
+    return ensure_available("models", model_name, root=root)
+
+
+def configure_sessions(
+    intra_op_threads: int | None = None,
+    inter_op_threads: int | None = None,
+    graph_optimization: str | None = None,
+    variant: str | None = None,
+    providers: Sequence[str] | None = None,
+) -> None:
+    """Set ONNX Runtime options for sessions built after this call; None keeps the current value.
+
+    Thread counts of 0 mean the ORT default. Worker pools use this to split
+    the cores between processes. ``variant`` selects the fp32, optimized or
+    int8 model files (see ``variant_file``); ``providers`` overrides
+    insightface's default execution provider list.
+    """
+    if graph_optimization is not None and graph_optimization not in GRAPH_OPTIMIZATION:
+        raise ValueError(f"graph_optimization must be one of: {', '.join(GRAPH_OPTIMIZATION)}")
+    if variant is not None and variant not in VARIANT_SUFFIXES:
+        raise ValueError(f"variant must be one of: {', '.join(VARIANT_SUFFIXES)}")
+    updates = {
+        "intra_op": intra_op_threads,
+        "inter_op": inter_op_threads,
+        "graph_optimization": graph_optimization,
+        "variant": variant,
+        "providers": list(providers) if providers is not None else None,
+    }
+    _SESSION.update({key: value for key, value in updates.items() if value is not None})
+
+
+def configure_runtime(runtime: dict | None, intra_op_threads: int | None = None) -> None:
+    """Apply the ``runtime`` config section; ``intra_op_threads`` (e.g. a worker's core share) wins over it."""
+    runtime = runtime or {}
+    configure_sessions(
+        intra_op_threads=intra_op_threads or runtime.get("intra_op_threads"),
+        inter_op_threads=runtime.get("inter_op_threads"),
+        graph_optimization=runtime.get("graph_optimization"),
+        variant=runtime.get("variant"),
+        providers=runtime.get("providers"),
+    )
+
+
+def session_variant() -> str:
+    return _SESSION["variant"]
+
+
+def variant_file(onnx_file: str, variant: str) -> str:
+    """Path of a model artefact: ``det_10g.onnx`` -> ``det_10g.opt.onnx`` / ``det_10g.int8.onnx``."""
+    return onnx_file[: -len(".onnx")] + VARIANT_SUFFIXES[variant]
+
+
+def session_options(onnx_file: str):
+    """ORT SessionOptions for ``onnx_file`` from the configured threads and optimisation level."""
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = _SESSION["intra_op"]
+    options.inter_op_num_threads = _SESSION["inter_op"]
+    if _SESSION["inter_op"] > 0:
+        # Inter-op threads are only used to run independent graph branches in parallel.
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    # An offline-optimised graph needs no second pass at load time.
+    level = "disable" if onnx_file.endswith(VARIANT_SUFFIXES["optimized"]) else _SESSION["graph_optimization"]
+    options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION[level])
+    return options
+
+
+def _build(task: str, onnx_file: str, ctx_id: int):
+    import onnxruntime
+    from insightface.model_zoo import model_zoo
+    from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+    from insightface.model_zoo.retinaface import RetinaFace
+
+    onnxruntime.set_default_logger_severity(3)
+    session = model_zoo.PickableInferenceSession(
+        onnx_file, sess_options=session_options(onnx_file), providers=_SESSION["providers"] or model_zoo.get_default_providers()
+    )
+    if task == "detection":
+        model = RetinaFace(model_file=onnx_file, session=session)
+        model.prepare(ctx_id, input_size=(640, 640), det_thresh=0.5)
+    else:
+        model = ArcFaceONNX(model_file=onnx_file, session=session)
+        model.prepare(ctx_id)
+    return model
+
+
+def find_onnx_file(task: str, model_name: str = "buffalo_l", root: str = "~/.insightface") -> str:
+    """Path of the original (fp32) ONNX file for ``task`` in a model pack."""
+    directory = model_dir(model_name, root)
+    known = PACK_FILES.get(model_name, {}).get(task)
+    if known and osp.exists(osp.join(directory, known)):
+        return osp.join(directory, known)
+
+    # Unknown pack layout: route every file once and keep the first match.
+    from insightface.model_zoo import model_zoo
+
+    derived = tuple(suffix for name, suffix in VARIANT_SUFFIXES.items() if name != "fp32")
+    originals = [f for f in sorted(glob.glob(osp.join(directory, "*.onnx"))) if not f.endswith(derived)]
+    for onnx_file in originals:
+        model = model_zoo.get_model(onnx_file)
+        if model is not None and model.taskname == task:
+            return onnx_file
+    raise FileNotFoundError(f"No {task} model found in pack '{model_name}' ({directory})")
+
+
+def get_model(task: str, model_name: str = "buffalo_l", ctx_id: int = 0, root: str = "~/.insightface"):
+    """Return the process-wide instance of one sub-model of an InsightFace pack.
+
+    ``task`` is ``"detection"`` (RetinaFace) or ``"recognition"`` (ArcFace).
+    Each (pack, task, ctx_id, variant) is loaded once and shared by every
+    caller; the variant is the one set by ``configure_sessions``.
+    """
+    if task not in TASKS:
+        raise ValueError(f"task must be one of: {', '.join(TASKS)}")
+
+    variant = _SESSION["variant"]
+    key = (model_name, task, ctx_id, variant)
+    with _LOCK:
+        model = _MODELS.get(key)
+        if model is None:
+            onnx_file = variant_file(find_onnx_file(task, model_name, root), variant)
+            if not osp.exists(onnx_file):
+                raise FileNotFoundError(
+                    f"No {variant} {task} model at {onnx_file}; build it with `python -m src.download_models --{'quantize' if variant == 'int8' else 'optimize'}`"
+                )
+            model = _build(task, onnx_file, ctx_id)
+            _MODELS[key] = model
+    return model
+
+
+@functools.lru_cache(maxsize=None)
+def model_version(onnx_file: str) -> str:
+    """Version tag of an ONNX model: ``<file name>:<content digest prefix>``.
+
+    Stored next to embeddings so vectors from different models (or a
+    re-exported file) are never compared with each other.
+    """
+    return f"{osp.basename(onnx_file)}:{file_digest(onnx_file)[:16]}"
+
+
+def clear_models() -> None:
+    """Drop all cached sessions (mainly for long-lived processes and tests)."""
+    with _LOCK:
+        _MODELS.clear()
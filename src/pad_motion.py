@@ -5,6 +5,61 @@ from typing import List
 import numpy as np
 import cv2
 
+from .align import gray_stack
+from .telemetry import timed
+
+
+def _score_from_mean_diff(mean_diff, low_threshold: float, high_threshold: float):
+    return np.where(mean_diff < low_threshold, 1.0, np.where(mean_diff > high_threshold, 0.7, 0.2))
+
+
+class MotionAccumulator:
+    """Running mean of consecutive grayscale frame differences.
+
+    Frames are consumed one at a time, so only the previous grayscale crop is kept.
+    """
+
+    def __init__(self, low_threshold: float = 2.0, high_threshold: float = 20.0):
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self._prev = None
+        self._diff_sum = 0.0
+        self._count = 0
+
+    @timed("pad_motion")
+    def update(self, frame_bgr: np.ndarray) -> None:
+        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        if self._prev is not None:
+            self._diff_sum += float(np.mean(cv2.absdiff(gray, self._prev)))
+            self._count += 1
+        self._prev = gray
+
+    @timed("pad_motion")
+    def score(self) -> float:
+        if self._count == 0:
+            return 0.0
+        return float(_score_from_mean_diff(self._diff_sum / self._count, self.low_threshold, self.high_threshold))
+
+
+def motion_scores(frames_bgr: np.ndarray, low_threshold: float = 2.0, high_threshold: float = 20.0) -> np.ndarray:
+    """Motion spoof scores for a (..., T, H, W, 3) uint8 stack, one per leading index.
+
+    Grayscale conversion and frame differencing run over the whole stack;
+    a single (T, H, W, 3) clip gives a 0-d array.
+    """
+    gray = gray_stack(frames_bgr)
+    lead = gray.shape[:-3]
+    t, h, w = gray.shape[-3:]
+    if t < 2:
+        return np.zeros(lead)
+    # Difference every frame with the next in one absdiff over the flattened
+    # stack, then drop the pairs that straddle two clips.
+    flat = gray.reshape(-1, w)
+    diff = cv2.absdiff(flat[h:], flat[:-h]).reshape(-1, h * w)
+    sums = np.append(diff.sum(axis=1, dtype=np.uint64), 0).reshape(-1, t)[:, : t - 1]
+    mean_diff = (sums.sum(axis=1) / ((t - 1) * h * w)).reshape(lead)
+    return _score_from_mean_diff(mean_diff, low_threshold, high_threshold)
+
 
 def motion_score(frames_bgr: List[np.ndarray], low_threshold: float = 2.0, high_threshold: float = 20.0) -> float:
     """Return motion-based spoof score in [0,1]. Higher = more suspicious.
@@ -13,18 +68,4 @@ def motion_score(frames_bgr: List[np.ndarray], low_threshold: float = 2.0, high_
     """
     if len(frames_bgr) < 2:
         return 0.0
-
-    diffs = []
-    prev = cv2.cvtColor(frames_bgr[0], cv2.COLOR_BGR2GRAY)
-    for frame in frames_bgr[1:]:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        diff = np.mean(cv2.absdiff(gray, prev))
-        diffs.append(diff)
-        prev = gray
-
-    mean_diff = float(np.mean(diffs))
-    if mean_diff < low_threshold:
-        return 1.0
-    if mean_diff > high_threshold:
-        return 0.7
-    return 0.2
+    return float(motion_scores(np.stack(frames_bgr), low_threshold, high_threshold))
@@ -5,33 +5,63 @@ from typing import List
 import numpy as np
 import cv2
 
+from .telemetry import timed
 
-def rppg_snr(frames_bgr: List[np.ndarray]) -> float:
-    """Estimate rPPG SNR from green channel mean signal.
 
-    Returns SNR in [0,1] (heuristic).
-    """
-    if len(frames_bgr) < 30:
-        return 0.0
+class RppgAccumulator:
+    """Collects the per-frame green-channel mean; frames themselves are not kept."""
+
+    def __init__(self, fps: float = 30.0):
+        self.fps = fps
+        self._green: List[float] = []
+
+    @timed("pad_rppg")
+    def update(self, frame_bgr: np.ndarray) -> None:
+        self._green.append(float(np.mean(frame_bgr[:, :, 1])))
 
-    g = []
-    for frame in frames_bgr:
-        green = frame[:, :, 1]
-        g.append(np.mean(green))
+    @timed("pad_rppg")
+    def score(self) -> float:
+        return snr_from_signal(self._green, self.fps)
 
-    signal = np.array(g, dtype=np.float32)
-    signal = signal - np.mean(signal)
 
-    fft = np.fft.rfft(signal)
-    power = np.abs(fft) ** 2
+def green_means(frames_bgr: np.ndarray) -> np.ndarray:
+    """Per-frame green-channel mean of a (..., T, H, W, 3) stack."""
+    return frames_bgr[..., 1].mean(axis=(-2, -1), dtype=np.float64)
 
-    # Rough band selection: 0.7-3.0 Hz mapped to bins by ratio
-    n = len(signal)
-    freqs = np.fft.rfftfreq(n, d=1 / 30)  # assume 30 fps
+
+def snr_from_signals(green: np.ndarray, fps: float = 30.0) -> np.ndarray:
+    """rPPG SNR in [0,1] for each row of an (N, T) green-mean array (one rfft call)."""
+    signal = np.asarray(green, dtype=np.float32)
+    if signal.shape[-1] < 30:
+        return np.zeros(signal.shape[:-1])
+    signal = signal - signal.mean(axis=-1, keepdims=True)
+
+    power = np.abs(np.fft.rfft(signal, axis=-1)) ** 2
+
+    # Heart-rate band 0.7-3.0 Hz (42-180 bpm) at the actual sampling rate
+    freqs = np.fft.rfftfreq(signal.shape[-1], d=1.0 / fps)
     band = (freqs >= 0.7) & (freqs <= 3.0)
-    band_power = float(np.sum(power[band]))
-    noise_power = float(np.sum(power[~band])) + 1e-9
+    band_power = power[..., band].sum(axis=-1, dtype=np.float64)
+    noise_power = power[..., ~band].sum(axis=-1, dtype=np.float64) + 1e-9
 
     snr = band_power / noise_power
-    snr_norm = float(np.clip(snr / 5.0, 0.0, 1.0))
-    return snr_norm
+    return np.clip(snr / 5.0, 0.0, 1.0)
+
+
+def snr_from_signal(green_means: List[float], fps: float = 30.0) -> float:
+    return float(snr_from_signals(np.asarray(green_means, dtype=np.float32)[None], fps)[0])
+
+
+def rppg_snrs(frames_bgr: np.ndarray, fps: float = 30.0) -> np.ndarray:
+    """rPPG SNR for a (N, T, H, W, 3) batch of equal-length clips."""
+    return snr_from_signals(green_means(frames_bgr), fps)
+
+
+def rppg_snr(frames_bgr: List[np.ndarray], fps: float = 30.0) -> float:
+    """Estimate rPPG SNR from green channel mean signal sampled at ``fps``.
+
+    Returns SNR in [0,1] (heuristic).
+    """
+    if len(frames_bgr) == 0:
+        return 0.0
+    return float(rppg_snrs(np.stack(frames_bgr)[None], fps)[0])
@@ -1,8 +1,23 @@
 from __future__ import annotations
 
 import numpy as np
-import cv2
-from skimage.feature import local_binary_pattern
+
+from .align import gray_stack
+from .lbp import uniform_lbp_hist
+from .telemetry import timed
+
+
+@timed("pad_texture")
+def texture_scores(faces_bgr: np.ndarray, lbp_points: int = 8, lbp_radius: int = 1) -> np.ndarray:
+    """Texture spoof scores for an (N, H, W, 3) uint8 stack of crops.
+
+    Heuristic: normalized LBP entropy. Grayscale conversion and the uniform
+    LBP histograms are computed for the whole stack at once.
+    """
+    hist = uniform_lbp_hist(gray_stack(faces_bgr), lbp_points, lbp_radius).astype(np.float32)
+    hist = hist / (hist.sum(axis=1, keepdims=True) + 1e-9)
+    entropy = -np.sum(hist * np.log(hist + 1e-9), axis=1)
+    return np.clip(entropy / 2.5, 0.0, 1.0)
 
 
 def texture_score(face_bgr: np.ndarray, lbp_points: int = 8, lbp_radius: int = 1) -> float:
@@ -10,11 +25,4 @@ def texture_score(face_bgr: np.ndarray, lbp_points: int = 8, lbp_radius: int = 1
 
     Heuristic: normalized LBP entropy.
     """
-    gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY)
-    lbp = local_binary_pattern(gray, lbp_points, lbp_radius, method="uniform")
-    hist, _ = np.histogram(lbp.ravel(), bins=lbp_points + 2, range=(0, lbp_points + 2))
-    hist = hist.astype(np.float32)
-    hist = hist / (hist.sum() + 1e-9)
-    entropy = -np.sum(hist * np.log(hist + 1e-9))
-    score = float(np.clip(entropy / 2.5, 0.0, 1.0))
-    return score
+    return float(texture_scores(face_bgr[None], lbp_points, lbp_radius)[0])
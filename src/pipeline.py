@@ -1,34 +1,113 @@
 from __future__ import annotations
 
 import argparse
+import csv
+import functools
+import itertools
+import json
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterable, List, TextIO
 
-import cv2
 import numpy as np
 import yaml
 
-from .detect import FaceDetector, select_largest_face
-from .align import crop_and_resize
+from .decode import DecodedImage
+from .detect import FaceBox, detector_from_config, select_largest_face
+from .align import align_face, crop_and_resize
 from .embed import FaceEmbedder
-from .match import cosine_similarity
+from .match import pairwise_cosine
+from .models import configure_runtime
 from .pad_texture import texture_score
 from .pad_freq import freq_score
-from .pad_motion import motion_score
-from .pad_rppg import rppg_snr
-from .fuse import PadScores, fuse_scores
+from .fuse import PAD_MODULES, PadDecision, decide
+from .quality import QualityReport, check_face, check_frame, quality_settings
+from .telemetry import collect, record_stages, request, stage
+from .video import VideoModuleStream, iter_face_crops, source_from_config, tracker_from_config
 
 
-def read_video_frames(video_path: Path, max_frames: int = 120) -> List[np.ndarray]:
-    cap = cv2.VideoCapture(str(video_path))
-    frames = []
-    while len(frames) < max_frames:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames
+class VerificationError(ValueError):
+    """Input that cannot be verified (unreadable file, no face)."""
+
+
+class QualityError(VerificationError):
+    """Capture rejected by the quality gate before (or instead of) full processing."""
+
+    def __init__(self, what: str, report: QualityReport):
+        super().__init__(f"{what.capitalize()} rejected by quality gate: {report.reason}")
+        self.what = what
+        self.reason = report.reason
+        self.metrics = report.metrics
+
+
+def check_quality(settings: dict | None, what: str, image: np.ndarray, face: FaceBox | None = None) -> bool:
+    """Raise QualityError if ``image`` fails the frame checks (or ``face`` the face checks).
+
+    No-op when ``settings`` is None (gate disabled). Bound to settings and a
+    name it serves as the ``screen`` hook of ``video.iter_face_crops``.
+    """
+    if settings is None:
+        return True
+    with stage("quality"):
+        report = check_frame(image, settings) if face is None else check_face(face, settings)
+    if not report.passed:
+        raise QualityError(what, report)
+    return True
+
+
+def reference_quality(config: dict) -> dict | None:
+    """Quality settings for reference (ID) images; None unless ``quality.check_reference``."""
+    settings = quality_settings(config)
+    return settings if settings is not None and settings.get("check_reference", True) else None
+
+
+def decode_image(config: dict, source) -> DecodedImage:
+    """Decode a path/bytes/array, at reduced JPEG scale when ``detector.adaptive`` allows it.
+
+    The longer side is kept at or above ``min_decode_face_px / min_face_fraction``,
+    so the smallest expected face still has ``min_decode_face_px`` pixels.
+    """
+    adaptive = config.get("detector", {}).get("adaptive") or {}
+    with stage("decode"):
+        if not adaptive.get("enabled", False):
+            return DecodedImage(source)
+        min_face_px = adaptive.get("min_decode_face_px", 160)
+        return DecodedImage(source, int(min_face_px / adaptive.get("min_face_fraction", 0.2)), min_face_px)
+
+
+def needs_full_resolution(decoded: DecodedImage, face: FaceBox | None) -> bool:
+    """A reduced decode may have cost the face: none found, or smaller than the decode assumed."""
+    return decoded.reduced and (face is None or min(face.w, face.h) < decoded.min_face_px)
+
+
+def locate_face(
+    detect: Callable[[np.ndarray], List[FaceBox]],
+    source: np.ndarray | DecodedImage,
+    settings: dict | None,
+    what: str,
+    missing: str,
+) -> tuple[np.ndarray, FaceBox]:
+    """Quality-check ``source``, detect its largest face and quality-check that face.
+
+    ``detect`` is the detector call (``detector.detect_faces``, or a wrapper
+    that runs it elsewhere, as ``async_pipeline`` does). Returns the image
+    the face was found in: the reduced decode, or the full-resolution one
+    if the reduced image did not hold a usable face.
+    """
+    decoded = source if isinstance(source, DecodedImage) else DecodedImage(source)
+    image = decoded.image
+    check_quality(settings, what, image)
+    face = select_largest_face(detect(image))
+    if needs_full_resolution(decoded, face):
+        image = decoded.full()
+        face = select_largest_face(detect(image))
+    if face is None:
+        raise VerificationError(missing)
+    check_quality(settings, what, image, face)
+    return image, face
 
 
 def load_config(config_path: Path) -> dict:
@@ -36,87 +115,259 @@ def load_config(config_path: Path) -> dict:
         return yaml.safe_load(f)
 
 
+def pad_result(decision: PadDecision) -> dict:
+    return {
+        "pad_score": float(decision.score),
+        "spoof": bool(decision.is_spoof),
+        "stages": list(decision.stages),
+        "modules": {name: float(score) for name, score in decision.modules.items()},
+    }
+
+
+def image_pad(config: dict, image: np.ndarray, face: FaceBox) -> PadDecision:
+    """PAD decision for one detected face in a still image."""
+    face_img = crop_and_resize(image, face)
+    pad = config["pad"]
+    scorers = {
+        "texture": lambda: texture_score(face_img, pad["texture"]["lbp_points"], pad["texture"]["lbp_radius"]),
+        "freq": lambda: freq_score(face_img, pad["freq"]["high_freq_ratio_threshold"]),
+    }
+    # A still image has no temporal signal: motion and rPPG are known to be 0.
+    return decide(scorers, config, known={"motion": 0.0, "rppg": 0.0})
+
+
+def match_result(config: dict, selfie_emb: np.ndarray, reference_emb: np.ndarray) -> dict:
+    with stage("match"):
+        sim = float(pairwise_cosine(selfie_emb[None], reference_emb[None])[0])
+    return {"similarity": sim, "match": sim >= config["recognition"]["cosine_threshold"]}
+
+
+def verify_image(
+    detector, embedder, config: dict, image: np.ndarray | DecodedImage, reference: np.ndarray | DecodedImage | None = None
+) -> dict:
+    """PAD on a selfie image and, with ``reference``, its cosine match to the reference face.
+
+    ``detector`` needs ``detect_faces(image)`` and ``embedder`` needs
+    ``embed_batch(faces)`` (None is fine without a reference), so batched
+    service wrappers can be passed in.
+    With the quality gate on, unusable captures raise QualityError before
+    the detector (blur, exposure) or before PAD/ArcFace (face size, pose).
+    Inputs may be DecodedImages from ``decode_image`` (reduced JPEG decode).
+    """
+    with request("image"):
+        image, face = locate_face(detector.detect_faces, image, quality_settings(config), "image", "No face detected")
+        result = pad_result(image_pad(config, image, face))
+
+        if reference is not None:
+            reference, ref_face = locate_face(detector.detect_faces, reference, reference_quality(config), "reference", "No face in reference")
+            emb = embedder.embed_batch([align_face(image, face), align_face(reference, ref_face)])
+            result.update(match_result(config, emb[0], emb[1]))
+    return result
+
+
+def verify_video(detector, config: dict, video_path: str | Path) -> dict:
+    """PAD on a selfie video, streamed frame by frame."""
+    with request("video"):
+        return _verify_video(detector, config, video_path)
+
+
+def _verify_video(detector, config: dict, video_path: str | Path) -> dict:
+    source = source_from_config(video_path, config)
+    frames = iter(source)
+    first = next(frames, None)
+    if first is None:
+        raise VerificationError("Failed to read video")
+    # crops are scored as frames are decoded (first-frame box, or tracked if enabled)
+    tracker = tracker_from_config(detector, config)
+    settings = quality_settings(config)
+    screen = functools.partial(check_quality, settings, "video") if settings is not None else None
+    crops = iter_face_crops(itertools.chain([first], frames), detector, tracker=tracker, screen=screen)
+    stream = VideoModuleStream(crops, config["pad"], fps=lambda: source.sample_fps)
+    try:
+        if stream.first_crop() is None:
+            raise VerificationError("No face detected")
+        decision = decide({name: functools.partial(stream.score, name) for name in PAD_MODULES}, config)
+    finally:
+        # A cascade may stop before the clip is fully decoded.
+        stream.close()
+        source.close()
+    return pad_result(decision)
+
+
+def print_result(result: dict) -> None:
+    print(f"PAD score: {result['pad_score']:.3f}, spoof={result['spoof']}, stages={','.join(result['stages'])}")
+    if "similarity" in result:
+        print(f"Cosine similarity: {result['similarity']:.3f}, match={result['match']}")
+
+
+# Batch mode. A manifest row names a selfie ``image`` (with an optional
+# ``reference``) or a ``video``; rows stream through one loaded model set.
+# Images are decoded on a prefetch pool up to ``window`` rows ahead while
+# ``workers`` threads run detection, PAD and ArcFace (ONNX Runtime releases
+# the GIL). Results are written as JSONL in manifest order.
+
+MANIFEST_FIELDS = ("id", "image", "reference", "video")
+
+
+def load_manifest(path: str | Path) -> List[dict]:
+    """Manifest rows from a CSV with a header (``id,image,reference,video``) or a JSONL file."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if str(path).endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [row for row in csv.DictReader(line for line in f if not line.startswith("#"))]
+    manifest = []
+    for index, row in enumerate(rows):
+        row = {key: (row.get(key) or "").strip() or None for key in MANIFEST_FIELDS}
+        if not row["image"] and not row["video"]:
+            raise ValueError(f"{path}: row {index} needs 'image' or 'video'")
+        manifest.append(row)
+    return manifest
+
+
+def _decode_row(config: dict, row: dict) -> tuple[DecodedImage | None, DecodedImage | None, dict]:
+    with record_stages() as stages:
+        image = decode_image(config, row["image"]) if row["image"] else None
+        reference = decode_image(config, row["reference"]) if row["reference"] and row["image"] else None
+    return image, reference, stages
+
+
+def _verify_row(detector, embedder, config: dict, index: int, row: dict, decoded: Future) -> dict:
+    out = {"index": index, "id": row["id"] if row["id"] is not None else str(index)}
+    timings = {}
+    # Stage names match the telemetry histograms; "request" is the whole verification.
+    with record_stages() as stages:
+        try:
+            if row["image"]:
+                image, reference, timings = decoded.result()
+                if image.image is None:
+                    raise VerificationError("Failed to read image")
+                if reference is not None and reference.image is None:
+                    raise VerificationError("Failed to read reference image")
+                out.update(verify_image(detector, embedder, config, image, reference))
+            else:
+                out.update(verify_video(detector, config, row["video"]))
+            out["status"] = "ok"
+        except QualityError as exc:
+            out.update(status="rejected", error=str(exc), input=exc.what, reason=exc.reason, quality=exc.metrics)
+        except VerificationError as exc:
+            out.update(status="failed", error=str(exc))
+        except Exception as exc:  # one bad row must not stop a nightly run
+            out.update(status="error", error=f"{type(exc).__name__}: {exc}")
+    out["timings_ms"] = {name: round(seconds * 1000, 3) for name, seconds in {**timings, **stages}.items()}
+    return out
+
+
+def run_batch(
+    detector, embedder, config: dict, rows: Iterable[dict], out: TextIO, workers: int = 2, prefetch: int = 4, window: int = 64
+) -> Counter:
+    """Verify manifest ``rows`` and write one JSON result per line to ``out``; returns counts by status.
+
+    ``prefetch`` threads decode images, ``workers`` threads verify, and at
+    most ``window`` rows are in flight, which bounds memory for decoded
+    frames. ``embedder`` may be None if no row has a reference.
+    """
+    counts: Counter = Counter()
+    items = enumerate(rows)
+    pending: deque = deque()
+    with ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="kyc-decode") as decode_pool, ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="kyc-verify"
+    ) as verify_pool:
+
+        def submit(index: int, row: dict) -> None:
+            decoded = decode_pool.submit(_decode_row, config, row)
+            pending.append(verify_pool.submit(_verify_row, detector, embedder, config, index, row, decoded))
+
+        for index, row in itertools.islice(items, max(1, window)):
+            submit(index, row)
+        while pending:
+            result = pending.popleft().result()
+            out.write(json.dumps(result) + "\n")
+            counts[result["status"]] += 1
+            nxt = next(items, None)
+            if nxt is not None:
+                submit(*nxt)
+    return counts
+
+
+def _main_batch(args: argparse.Namespace, config: dict) -> int:
+    rows = load_manifest(args.manifest)
+    detector = detector_from_config(config)
+    embedder = FaceEmbedder(batch_size=config["recognition"].get("batch_size", 64)) if any(r["reference"] for r in rows) else None
+    if args.workers > 1:
+        # Concurrent rows share detector / ArcFace session calls.
+        from .service import BatchedDetector, BatchedEmbedder
+
+        service = config.get("service") or {}
+        detector = BatchedDetector(detector, args.workers)
+        if embedder is not None:
+            embedder = BatchedEmbedder(embedder, 2 * args.workers, service.get("max_wait_ms", 5.0))
+    start = time.perf_counter()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = run_batch(detector, embedder, config, rows, out, args.workers, args.prefetch, args.window)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        for wrapper in (detector, embedder):
+            if hasattr(wrapper, "close"):
+                wrapper.close()
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{status}={n}" for status, n in sorted(counts.items()))
+    print(f"{len(rows)} rows in {elapsed:.1f} s ({len(rows) / max(elapsed, 1e-9) * 60:.0f}/min): {summary}", file=sys.stderr)
+    return 0
+
+
+def _main_single(args: argparse.Namespace, config: dict) -> int:
+    detector = detector_from_config(config)
+    # ArcFace is only needed for a reference match; PAD-only runs skip loading it.
+    embedder = FaceEmbedder(batch_size=config["recognition"].get("batch_size", 64)) if args.reference else None
+
+    try:
+        if args.image:
+            image = decode_image(config, args.image)
+            if image.image is None:
+                raise VerificationError("Failed to read image")
+            ref = None
+            if args.reference:
+                ref = decode_image(config, args.reference)
+                if ref.image is None:
+                    raise VerificationError("Failed to read reference image")
+            result = verify_image(detector, embedder, config, image, ref)
+        else:
+            result = verify_video(detector, config, args.video)
+    except VerificationError as exc:
+        print(exc)
+        return 1
+
+    print_result(result)
+    return 0
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="KYC baseline pipeline (det/rec/PAD)")
     parser.add_argument("--image", type=str, help="Input selfie image path")
     parser.add_argument("--video", type=str, help="Input selfie video path")
     parser.add_argument("--reference", type=str, help="Reference ID face image path")
     parser.add_argument("--config", type=str, default="configs/thresholds.yaml")
+    parser.add_argument("--manifest", type=str, help="Batch mode: CSV (id,image,reference,video) or JSONL of rows to verify")
+    parser.add_argument("--output", type=str, default=None, help="Batch mode: JSONL results file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=2, help="Batch mode: rows verified concurrently")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batch mode: image decode threads")
+    parser.add_argument("--window", type=int, default=64, help="Batch mode: maximum rows in flight")
+    parser.add_argument("--metrics-out", type=str, default=None, help="Write per-stage latency histograms (Prometheus text) here")
     args = parser.parse_args()
 
-    if not args.image and not args.video:
-        print("Provide --image or --video")
+    if not args.image and not args.video and not args.manifest:
+        print("Provide --image, --video or --manifest")
         return 1
 
     config = load_config(Path(args.config))
-
-    detector_backend = config.get("detector", {}).get("backend", "retinaface")
-    detector = FaceDetector(backend=detector_backend)
-    embedder = FaceEmbedder()
-
-    if args.image:
-        image = cv2.imread(args.image)
-        if image is None:
-            print("Failed to read image")
-            return 1
-        boxes = detector.detect_faces(image)
-        face = select_largest_face(boxes)
-        if face is None:
-            print("No face detected")
-            return 1
-        face_img = crop_and_resize(image, face)
-
-        tex = texture_score(face_img, config["pad"]["texture"]["lbp_points"], config["pad"]["texture"]["lbp_radius"])
-        fq = freq_score(face_img, config["pad"]["freq"]["high_freq_ratio_threshold"])
-        scores = PadScores(texture=tex, freq=fq, motion=0.0, rppg=0.0)
-        decision = fuse_scores(scores, config["fusion"]["weights"], config["fusion"]["decision_threshold"])
-
-        print(f"PAD score: {decision.score:.3f}, spoof={decision.is_spoof}")
-
-        if args.reference:
-            ref = cv2.imread(args.reference)
-            if ref is None:
-                print("Failed to read reference image")
-                return 1
-            ref_boxes = detector.detect_faces(ref)
-            ref_face = select_largest_face(ref_boxes)
-            if ref_face is None:
-                print("No face in reference")
-                return 1
-            ref_img = crop_and_resize(ref, ref_face)
-
-            emb1 = embedder.embed(face_img)
-            emb2 = embedder.embed(ref_img)
-            sim = cosine_similarity(emb1, emb2)
-            thr = config["recognition"]["cosine_threshold"]
-            print(f"Cosine similarity: {sim:.3f}, match={sim >= thr}")
-        return 0
-
-    if args.video:
-        frames = read_video_frames(Path(args.video))
-        if not frames:
-            print("Failed to read video")
-            return 1
-        # detect face on first frame for PAD features
-        boxes = detector.detect_faces(frames[0])
-        face = select_largest_face(boxes)
-        if face is None:
-            print("No face detected")
-            return 1
-        face_frames = [crop_and_resize(f, face) for f in frames]
-
-        tex = texture_score(face_frames[0], config["pad"]["texture"]["lbp_points"], config["pad"]["texture"]["lbp_radius"])
-        fq = freq_score(face_frames[0], config["pad"]["freq"]["high_freq_ratio_threshold"])
-        mot = motion_score(face_frames, config["pad"]["motion"]["mean_diff_low_threshold"], config["pad"]["motion"]["mean_diff_high_threshold"])
-        rppg = rppg_snr(face_frames)
-
-        scores = PadScores(texture=tex, freq=fq, motion=mot, rppg=rppg)
-        decision = fuse_scores(scores, config["fusion"]["weights"], config["fusion"]["decision_threshold"])
-
-        print(f"PAD score: {decision.score:.3f}, spoof={decision.is_spoof}")
-        return 0
-
-    return 0
+    configure_runtime(config.get("runtime"))
+    with collect(args.metrics_out, config.get("telemetry")):
+        if args.manifest:
+            return _main_batch(args, config)
+        return _main_single(args, config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from .telemetry import save_snapshot
+
+# Sharded evaluation runner. Items are split into fixed-size shards; each
+# shard is processed by one worker and written as <out_dir>/shard_NNNNNN.jsonl
+# (atomically, via rename), so an interrupted run resumes by skipping every
+# shard already on disk. Workers build their models once in the initializer.
+# run.json pins the items, the settings the rows depend on and the row schema,
+# so a resume never mixes shards scored under different configs or formats.
+
+_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(init_fn: Callable, init_args: tuple) -> None:
+    _STATE["ctx"] = init_fn(*init_args)
+
+
+def _shard_path(out_dir: Path, shard_id: int) -> Path:
+    return out_dir / f"shard_{shard_id:06d}.jsonl"
+
+
+def _write_shard(path: Path, rows: List[dict]) -> None:
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    os.replace(tmp, path)
+
+
+def _run_shard(work_fn: Callable, shard_id: int, start: int, items: list, out_dir: str) -> int:
+    rows = work_fn(_STATE["ctx"], start, items)
+    _write_shard(_shard_path(Path(out_dir), shard_id), rows)
+    save_snapshot()
+    return shard_id
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _check_manifest(out_dir: Path, items: Sequence, shard_size: int, params: dict | None, schema: int) -> None:
+    meta = {"items": len(items), "digest": _digest(list(items)), "shard_size": shard_size, "params": _digest(params), "schema": schema}
+    meta_path = out_dir / "run.json"
+    if meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        # Manifests without a schema predate versioning: schema 1.
+        if previous.get("schema", 1) != schema:
+            raise ValueError(
+                f"{out_dir} holds shards in row schema {previous.get('schema', 1)} (this version writes {schema}); use a new --out-dir"
+            )
+        if previous.get("params") != meta["params"]:
+            raise ValueError(f"{out_dir} holds shards scored with different settings (config, models, quality); use a new --out-dir")
+        if previous != meta:
+            raise ValueError(f"{out_dir} holds shards of a different run; use a new --out-dir")
+        return
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def load_shards(out_dir: str | Path) -> List[dict]:
+    """All rows written so far, in item order."""
+    rows = []
+    for path in sorted(Path(out_dir).glob("shard_*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    rows.sort(key=lambda r: r["index"])
+    return rows
+
+
+@contextmanager
+def shard_dir(out_dir: str | Path | None) -> Iterator[Path]:
+    """``out_dir`` if given (resumable), else a temporary directory for this run only."""
+    if out_dir is not None:
+        yield Path(out_dir)
+        return
+    with tempfile.TemporaryDirectory(prefix="kyc-shards-") as tmp:
+        yield Path(tmp)
+
+
+def run_sharded(
+    items: Sequence,
+    work_fn: Callable,
+    init_fn: Callable,
+    init_args: tuple = (),
+    out_dir: str | Path = "runs/eval",
+    shard_size: int = 1000,
+    workers: int = 1,
+    params: dict | None = None,
+    schema: int = 1,
+) -> List[dict]:
+    """Process ``items`` in resumable shards and return every row in item order.
+
+    ``init_fn(*init_args)`` builds the per-worker context (models, config).
+    ``work_fn(ctx, start, shard_items)`` returns JSON-serialisable dict rows,
+    each with an ``"index"`` key (``start`` + position in the shard). Both must
+    be module-level functions so they can be sent to spawned workers.
+    ``params`` are the settings the rows depend on and ``schema`` the row
+    format version; resuming an ``out_dir`` written with either different
+    raises ValueError.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    shard_size = max(1, shard_size)
+    _check_manifest(out, items, shard_size, params, schema)
+
+    pending = [
+        (shard_id, start)
+        for shard_id, start in enumerate(range(0, len(items), shard_size))
+        if not _shard_path(out, shard_id).exists()
+    ]
+    done = (len(items) + shard_size - 1) // shard_size - len(pending)
+    if done:
+        print(f"Resuming: {done} shard(s) already complete")
+
+    if workers <= 1:
+        _init_worker(init_fn, init_args)
+        for shard_id, start in pending:
+            _run_shard(work_fn, shard_id, start, list(items[start : start + shard_size]), str(out))
+        return load_shards(out)
+
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(init_fn, init_args)) as pool:
+        futures = [
+            pool.submit(_run_shard, work_fn, shard_id, start, list(items[start : start + shard_size]), str(out))
+            for shard_id, start in pending
+        ]
+        for future in as_completed(futures):
+            future.result()
+    return load_shards(out)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from .decode import DecodedImage
+from .detect import FaceBox, FaceDetector, detector_from_config
+from .embed import FaceEmbedder
+from .models import configure_runtime
+from .pipeline import QualityError, VerificationError, decode_image, load_config, verify_image, verify_video
+from . import telemetry
+
+# Long-running verification service. Models and config are loaded once;
+# request threads do decoding, cropping and PAD themselves, while detector and
+# ArcFace calls go through MicroBatchers that gather concurrent requests into
+# one session call each.
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Groups items submitted from many threads into calls of ``fn(list) -> list``.
+
+    A batch is dispatched when it reaches ``max_batch_size`` items or
+    ``max_wait_ms`` after its first item arrived, whichever comes first. One
+    worker thread makes all calls, so the wrapped session is never entered
+    concurrently.
+    """
+
+    def __init__(self, fn: Callable[[List], Sequence], max_batch_size: int = 16, max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                return
+            batch, stop = self._collect(entry)
+            try:
+                outputs = self.fn([item for item, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"{self._thread.name}: {len(outputs)} outputs for {len(batch)} inputs")
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+            if stop:
+                return
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class BatchedDetector:
+    """``detect_faces`` routed through a MicroBatcher.
+
+    The RetinaFace graph takes one image per run, so a batch is detected
+    image by image on the batcher thread; concurrent requests still share one
+    session without contending for it. Waiting for a batch to fill would only
+    add latency, so calls are dispatched immediately (requests that queued up
+    meanwhile are taken along).
+    """
+
+    def __init__(self, detector: FaceDetector, max_batch_size: int):
+        self.detector = detector
+        self._batcher = MicroBatcher(self._detect_many, max_batch_size, max_wait_ms=0.0, name="detector-batcher")
+
+    def _detect_many(self, images: List[np.ndarray]) -> List[List[FaceBox]]:
+        return [self.detector.detect_faces(image) for image in images]
+
+    def detect_faces(self, image_bgr: np.ndarray) -> List[FaceBox]:
+        start = time.perf_counter()
+        faces = self._batcher.submit(image_bgr).result()
+        # The detector stage ran on the batcher thread; credit the wait to the caller's row timings.
+        telemetry.note("detect", time.perf_counter() - start)
+        return faces
+
+    def close(self) -> None:
+        self._batcher.close()
+
+
+class BatchedEmbedder:
+    """``embed_batch`` whose crops are pooled with other requests' into one ArcFace run."""
+
+    def __init__(self, embedder: FaceEmbedder, max_batch_size: int, max_wait_ms: float):
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self._batcher = MicroBatcher(self._embed_many, max_batch_size, max_wait_ms, name="embedder-batcher")
+
+    def _embed_many(self, faces: List[np.ndarray]) -> np.ndarray:
+        return self.embedder.embed_batch(faces, batch_size=len(faces))
+
+    def embed_batch(self, faces: Sequence[np.ndarray]) -> np.ndarray:
+        start = time.perf_counter()
+        futures = [self._batcher.submit(face) for face in faces]
+        if not futures:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        emb = np.stack([future.result() for future in futures])
+        telemetry.note("embed", time.perf_counter() - start)
+        return emb
+
+    def close(self) -> None:
+        self._batcher.close()
+
+
+def _decode_image(config: dict, request: dict, key: str) -> DecodedImage | None:
+    """Image from ``<key>`` (path) or ``<key>_b64`` (base64 file bytes); None if neither is given."""
+    if request.get(f"{key}_b64"):
+        image = decode_image(config, base64.b64decode(request[f"{key}_b64"]))
+    elif request.get(key):
+        image = decode_image(config, request[key])
+    else:
+        return None
+    if image.image is None:
+        raise VerificationError(f"Failed to read {key}")
+    return image
+
+
+class VerificationService:
+    """Models loaded once; ``verify`` is safe to call from many threads."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        service = config.get("service") or {}
+        max_batch = service.get("max_batch_size", 16)
+        max_wait = service.get("max_wait_ms", 5.0)
+        configure_runtime(config.get("runtime"))
+        telemetry.configure(config.get("telemetry"))
+        detector = detector_from_config(config)
+        embedder = FaceEmbedder(batch_size=config["recognition"].get("batch_size", 64))
+        self.detector = BatchedDetector(detector, max_batch)
+        self.embedder = BatchedEmbedder(embedder, max_batch, max_wait)
+
+    def verify(self, request: dict) -> dict:
+        """``{"video": path}`` or ``{"image"|"image_b64": ..., ["reference"|"reference_b64": ...]}``."""
+        if request.get("video"):
+            return verify_video(self.detector, self.config, request["video"])
+        image = _decode_image(self.config, request, "image")
+        if image is None:
+            raise ValueError("request needs 'image', 'image_b64' or 'video'")
+        return verify_image(self.detector, self.embedder, self.config, image, _decode_image(self.config, request, "reference"))
+
+    def close(self) -> None:
+        self.detector.close()
+        self.embedder.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "kyc-verify/1.0"
+    service: VerificationService
+
+    def _send(self, status: int, body: dict | str) -> None:
+        if isinstance(body, str):
+            data, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(body).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics" and telemetry.is_enabled():
+            self._send(200, telemetry.render())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/verify":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            result = self.service.verify(request)
+        except QualityError as exc:
+            self._send(422, {"error": str(exc), "input": exc.what, "reason": exc.reason, "quality": exc.metrics})
+        except VerificationError as exc:
+            self._send(422, {"error": str(exc)})
+        except (ValueError, TypeError) as exc:
+            self._send(400, {"error": str(exc)})
+        except Exception as exc:  # pragma: no cover
+            self._send(500, {"error": f"{type(exc).__name__}: {exc}"})
+        else:
+            self._send(200, result)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: VerificationService, host: str = "127.0.0.1", port: int = 8080, unix_socket: str | None = None):
+    """HTTP server for ``service`` on TCP ``host:port`` or on a Unix socket path."""
+    handler = type("Handler", (_Handler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Persistent KYC verification service (HTTP / Unix socket)")
+    parser.add_argument("--config", default="configs/thresholds.yaml")
+    parser.add_argument("--host", default=None, help="Overrides service.host")
+    parser.add_argument("--port", type=int, default=None, help="Overrides service.port")
+    parser.add_argument("--unix-socket", default=None, help="Listen on this socket path instead of TCP")
+    args = parser.parse_args()
+
+    config = load_config(Path(args.config))
+    settings = config.get("service") or {}
+    host = args.host or settings.get("host", "127.0.0.1")
+    port = args.port if args.port is not None else settings.get("port", 8080)
+    unix_socket = args.unix_socket or settings.get("unix_socket")
+
+    service = VerificationService(config)
+    server = make_server(service, host, port, unix_socket)
+    print(f"Listening on {unix_socket or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import bisect
+import cProfile
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+# Per-stage latency instrumentation. Stages (decode, quality, detect, track,
+# align, embed, pad_<module>, pad, request) wrap their work in ``stage(name,
+# backend)`` or ``@timed``; each (stage, backend) pair keeps a cumulative
+# histogram that renders as Prometheus text. ``record_stages`` additionally
+# collects the durations of one thread's stages (e.g. per manifest row), with
+# or without the histograms. While neither is active, ``stage`` hands back a
+# shared no-op context and ``timed`` calls straight through, so the cost is
+# one global check per call. Sampled requests can additionally be run under
+# cProfile and tracemalloc.
+
+BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC = "kyc_stage_latency_seconds"
+# Settings (JSON) inherited by spawned worker processes, which write their
+# histograms as snapshots into ``snapshot_dir`` for the parent to merge.
+ENV = "KYC_TELEMETRY"
+
+DEFAULTS = {
+    "enabled": False,
+    "profile_every": 0,  # run every Nth request under cProfile; 0 = never
+    "profile_dir": "runs/profiles",
+    "tracemalloc": False,  # also record allocations of profiled requests
+}
+
+
+class Histogram:
+    """Cumulative latency histogram over BUCKETS_S (plus +Inf)."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_S) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_S, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, counts, total: float, count: int) -> None:
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+
+
+class Registry:
+    """Histograms keyed by (stage, backend); safe to update from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, stage: str, backend: str, seconds: float) -> None:
+        with self._lock:
+            hist = self.histograms.get((stage, backend))
+            if hist is None:
+                hist = self.histograms[(stage, backend)] = Histogram()
+            hist.observe(seconds)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[stage, backend, h.counts, h.total, h.count] for (stage, backend), h in sorted(self.histograms.items())]
+
+    def merge(self, snapshot: list) -> None:
+        with self._lock:
+            for stage, backend, counts, total, count in snapshot:
+                self.histograms.setdefault((stage, backend), Histogram()).merge(counts, total, count)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [f"# HELP {METRIC} Latency of KYC pipeline stages.", f"# TYPE {METRIC} histogram"]
+        for stage, backend, counts, total, count in self.snapshot():
+            labels = f'stage="{stage}",backend="{backend}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS_S + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{METRIC}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{METRIC}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{METRIC}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+_settings = dict(DEFAULTS)
+_enabled = False
+_requests = 0
+_requests_lock = threading.Lock()
+# Per-thread stage durations for ``record_stages``; ``_recorders`` counts the active ones.
+_local = threading.local()
+_recorders = 0
+_recorders_lock = threading.Lock()
+# cProfile can only follow one request at a time.
+_profile_lock = threading.Lock()
+
+
+class _Timer:
+    __slots__ = ("stage", "backend", "start")
+
+    def __init__(self, stage: str, backend: str):
+        self.stage = stage
+        self.backend = backend
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        seconds = time.perf_counter() - self.start
+        if _enabled:
+            REGISTRY.observe(self.stage, self.backend, seconds)
+        note(self.stage, seconds)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NO_TIMER = _NoTimer()
+
+
+def configure(section: dict | None = None, enabled: bool | None = None) -> None:
+    """Apply the ``telemetry`` config section; ``enabled`` (e.g. from --metrics-out) overrides it."""
+    global _enabled
+    _settings.update(DEFAULTS)
+    _settings.update(section or {})
+    _enabled = bool(_settings["enabled"] if enabled is None else enabled)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def stage(name: str, backend: str = ""):
+    """Context manager timing one stage call (no-op while telemetry is disabled and nothing records)."""
+    return _Timer(name, backend) if _enabled or _recorders else _NO_TIMER
+
+
+def timed(name: str, backend: str = ""):
+    """Decorator form of ``stage``."""
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not (_enabled or _recorders):
+                return fn(*args, **kwargs)
+            with _Timer(name, backend):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+def note(name: str, seconds: float) -> None:
+    """Add ``seconds`` to stage ``name`` of this thread's ``record_stages`` (no histogram).
+
+    For work another thread did on this one's behalf, e.g. a micro-batched model call.
+    """
+    stages = getattr(_local, "stages", None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def record_stages() -> Iterator[Dict[str, float]]:
+    """Collect the calling thread's stage durations (seconds, summed per stage name) into the yielded dict."""
+    global _recorders
+    outer = getattr(_local, "stages", None)
+    stages: Dict[str, float] = {}
+    _local.stages = stages
+    with _recorders_lock:
+        _recorders += 1
+    try:
+        yield stages
+    finally:
+        with _recorders_lock:
+            _recorders -= 1
+        _local.stages = outer
+
+
+def _write_profile(kind: str, n: int, profiler: cProfile.Profile, memory: tracemalloc.Snapshot | None) -> None:
+    out = Path(_settings["profile_dir"])
+    out.mkdir(parents=True, exist_ok=True)
+    stem = out / f"{kind}-{os.getpid()}-{n:06d}"
+    profiler.dump_stats(f"{stem}.prof")
+    if memory is not None:
+        with open(f"{stem}.mem.txt", "w", encoding="utf-8") as f:
+            for stat in memory.statistics("lineno")[:25]:
+                f.write(f"{stat}\n")
+
+
+@contextmanager
+def request(kind: str) -> Iterator[None]:
+    """Time one verification as stage "request" (backend = ``kind``), profiling every Nth one.
+
+    Sampled requests are written to ``profile_dir`` as ``<kind>-<pid>-<n>.prof``
+    (load with ``pstats``) and, with ``tracemalloc``, the top allocation sites
+    as ``.mem.txt``. cProfile follows the calling thread only.
+    """
+    global _requests
+    if not _enabled:
+        with stage("request", kind):
+            yield
+        return
+    with _requests_lock:
+        _requests += 1
+        n = _requests
+    every = _settings["profile_every"]
+    profiler = None
+    if every and n % every == 0 and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+    try:
+        with _Timer("request", kind):
+            if profiler is None:
+                yield
+                return
+            started_tracing = _settings["tracemalloc"] and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                memory = tracemalloc.take_snapshot() if _settings["tracemalloc"] else None
+                if started_tracing:
+                    tracemalloc.stop()
+                _write_profile(kind, n, profiler, memory)
+    finally:
+        if profiler is not None:
+            _profile_lock.release()
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def write(path: str | Path) -> None:
+    """Write the Prometheus text to ``path`` atomically (e.g. for node_exporter's textfile collector)."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp{os.getpid()}")
+    tmp.write_text(render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def save_snapshot() -> None:
+    """In a worker process spawned under ``collect``, store this process's histograms for the parent."""
+    inherited = os.environ.get(ENV)
+    if not _enabled or not inherited:
+        return
+    settings = json.loads(inherited)
+    if settings["parent_pid"] == os.getpid():
+        return
+    path = Path(settings["snapshot_dir"]) / f"telemetry-{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(REGISTRY.snapshot()), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+@contextmanager
+def collect(metrics_out: str | Path | None, section: dict | None = None) -> Iterator[None]:
+    """CLI helper: apply the ``telemetry`` section; with ``metrics_out``, also
+    enable telemetry for the block and write the metrics file after it.
+
+    Worker processes spawned inside the block inherit the settings and
+    their histograms are merged in (see ``save_snapshot``).
+    """
+    if not metrics_out:
+        configure(section)
+        yield
+        return
+    configure(section, enabled=True)
+    with tempfile.TemporaryDirectory(prefix="kyc-telemetry-") as snapshot_dir:
+        os.environ[ENV] = json.dumps({**_settings, "enabled": True, "snapshot_dir": snapshot_dir, "parent_pid": os.getpid()})
+        try:
+            yield
+        finally:
+            del os.environ[ENV]
+            for path in sorted(Path(snapshot_dir).glob("telemetry-*.json")):
+                REGISTRY.merge(json.loads(path.read_text(encoding="utf-8")))
+            write(metrics_out)
+
+
+if os.environ.get(ENV):
+    configure(json.loads(os.environ[ENV]))
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+from typing import List, Tuple
+
+import numpy as np
+
+from .metrics import equal_error_rate, error_curve, rates_at_threshold
+
+
+def weight_grid(n_modules: int, step: float) -> np.ndarray:
+    """All weight vectors on the simplex with entries in multiples of ``step``."""
+    units = int(round(1.0 / step))
+    rows = [
+        c
+        for c in itertools.product(range(units + 1), repeat=n_modules - 1)
+        if sum(c) <= units
+    ]
+    grid = np.array([list(c) + [units - sum(c)] for c in rows], dtype=np.float64)
+    return grid / units
+
+
+def thresholds_for_apcer(attack_scores: np.ndarray, target: float) -> np.ndarray:
+    """Highest threshold per column with APCER (attack scores < thr) <= target.
+
+    ``attack_scores`` is (P, M): one column per weight candidate.
+    """
+    ordered = np.sort(attack_scores, axis=0)
+    k = min(int(np.floor(target * ordered.shape[0])), ordered.shape[0] - 1)
+    return ordered[k]
+
+
+def thresholds_for_bpcer(bona_scores: np.ndarray, target: float) -> np.ndarray:
+    """Lowest threshold per column with BPCER (bona fide scores >= thr) <= target."""
+    ordered = -np.sort(-bona_scores, axis=0)
+    k = int(np.floor(target * ordered.shape[0]))
+    if k >= ordered.shape[0]:
+        return np.full(ordered.shape[1], -np.inf)
+    return np.nextafter(ordered[k], np.inf)
+
+
+def search(
+    components: np.ndarray,
+    labels: np.ndarray,
+    weights: np.ndarray,
+    apcer_target: float | None = 0.05,
+    bpcer_target: float | None = None,
+    chunk: int = 256,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Evaluate every weight row; returns (threshold, apcer, bpcer) per row.
+
+    With ``apcer_target`` each candidate's threshold is the one minimising
+    BPCER subject to APCER <= target; with ``bpcer_target`` the reverse.
+    """
+    is_attack = labels == 1
+    attack = components[is_attack]
+    bona = components[~is_attack]
+    thr = np.empty(len(weights))
+    apcer = np.empty(len(weights))
+    bpcer = np.empty(len(weights))
+
+    for start in range(0, len(weights), chunk):
+        w = weights[start : start + chunk].T
+        a_scores = attack @ w
+        b_scores = bona @ w
+        if bpcer_target is not None:
+            t = thresholds_for_bpcer(b_scores, bpcer_target)
+        else:
+            t = thresholds_for_apcer(a_scores, apcer_target)
+        end = start + w.shape[1]
+        thr[start:end] = t
+        apcer[start:end] = (a_scores < t).mean(axis=0)
+        bpcer[start:end] = (b_scores >= t).mean(axis=0)
+    return thr, apcer, bpcer
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tune PAD fusion weights and decision threshold from cached module scores")
+    parser.add_argument("--components", required=True, help=".npz written by eval_pad --components-out")
+    parser.add_argument("--step", type=float, default=0.05, help="Weight grid step")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--apcer-target", type=float, default=0.05, help="Minimise BPCER subject to APCER <= target")
+    target.add_argument("--bpcer-target", type=float, default=None, help="Minimise APCER subject to BPCER <= target")
+    parser.add_argument("--top", type=int, default=5, help="Candidates to print")
+    args = parser.parse_args()
+
+    data = np.load(args.components)
+    components = data["components"].astype(np.float64)
+    labels = data["labels"]
+    modules: List[str] = [str(m) for m in data["modules"]]
+    if not (labels == 1).any() or not (labels == 0).any():
+        print("Need both attack and bona fide samples")
+        return 1
+
+    weights = weight_grid(len(modules), args.step)
+    thr, apcer, bpcer = search(components, labels, weights, args.apcer_target, args.bpcer_target)
+    objective = apcer if args.bpcer_target is not None else bpcer
+    # Rank by the optimised error rate; ties go to the lower total error.
+    order = np.lexsort((apcer + bpcer, objective))
+
+    print(f"Samples: {len(labels)}, candidates: {len(weights)}")
+    for rank, i in enumerate(order[: args.top], start=1):
+        desc = ", ".join(f"{m}={w:.2f}" for m, w in zip(modules, weights[i]))
+        print(f"#{rank}: {desc} | threshold={thr[i]:.4f} APCER={apcer[i]:.4f} BPCER={bpcer[i]:.4f}")
+
+    best = order[0]
+    fused = components @ weights[best]
+    eer, eer_thr = equal_error_rate(error_curve(fused, labels))
+    bp, ap = rates_at_threshold(fused, labels, thr[best])
+    print(f"Best EER-like: {eer:.4f} at threshold {eer_thr:.4f}")
+    print("fusion:")
+    print("  weights:")
+    for m, w in zip(modules, weights[best]):
+        print(f"    {m}: {w:.2f}")
+    print(f"  decision_threshold: {thr[best]:.4f}  # APCER={ap:.4f} BPCER={bp:.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+from .align import crop_and_resize
+from .detect import FaceBox, FaceDetector, FaceTracker, select_largest_face
+from .fuse import PAD_MODULES
+from .pad_freq import freq_score
+from .pad_motion import MotionAccumulator
+from .pad_rppg import RppgAccumulator
+from .pad_texture import texture_score
+
+# Video PAD is computed as a stream: each decoded frame is cropped to the face
+# and handed to the per-module accumulators, so only one full-resolution frame
+# (plus the 112x112 crop) is alive at a time instead of the whole clip.
+
+
+DEFAULT_FPS = 30.0
+
+
+class VideoFrameSource:
+    """Decoded frames of one video, optionally subsampled and downscaled.
+
+    ``fps`` is the container frame rate (``DEFAULT_FPS`` when the container
+    does not report one). With ``target_fps`` only every ``step``-th frame is
+    retrieved; skipped frames are only ``grab()``-ed, which avoids the
+    colour conversion and copy of ``retrieve()``. ``max_side`` downscales each
+    retrieved frame right away so nothing larger is kept. ``timestamps`` are
+    the positions of the yielded frames in ms and ``sample_fps`` their rate,
+    measured from the timestamps (variable-frame-rate phone clips drift far
+    from the container's nominal rate).
+    Iterate once; the capture is released when iteration ends or on ``close()``.
+    """
+
+    def __init__(
+        self,
+        video_path: str | Path,
+        max_frames: int = 120,
+        target_fps: float | None = None,
+        max_side: int | None = None,
+    ):
+        self.max_frames = max_frames
+        self.max_side = max_side
+        self._cap = cv2.VideoCapture(str(video_path))
+        fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.fps = float(fps) if fps and np.isfinite(fps) and fps > 0 else DEFAULT_FPS
+        self.step = max(1, int(round(self.fps / target_fps))) if target_fps else 1
+        self.timestamps: List[float] = []
+
+    @property
+    def sample_fps(self) -> float:
+        """Rate of the frames yielded so far; the nominal ``fps / step`` until two distinct timestamps exist."""
+        t = self.timestamps
+        if len(t) >= 2 and t[-1] > t[0]:  # missing timestamps read as all 0
+            return (len(t) - 1) * 1000.0 / (t[-1] - t[0])
+        return self.fps / self.step
+
+    def _resize(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        if not self.max_side or max(h, w) <= self.max_side:
+            return frame
+        scale = self.max_side / float(max(h, w))
+        return cv2.resize(frame, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        cap = self._cap
+        try:
+            index = 0
+            while len(self.timestamps) < self.max_frames:
+                if not cap.grab():
+                    break
+                if index % self.step == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    self.timestamps.append(float(cap.get(cv2.CAP_PROP_POS_MSEC)))
+                    yield self._resize(frame)
+                index += 1
+        finally:
+            cap.release()
+
+    def close(self) -> None:
+        self._cap.release()
+
+
+def source_from_config(video_path: str | Path, config: dict) -> VideoFrameSource:
+    """VideoFrameSource from the ``video`` config section."""
+    video = config.get("video") or {}
+    return VideoFrameSource(
+        video_path,
+        max_frames=video.get("max_frames", 120),
+        target_fps=video.get("target_fps"),
+        max_side=video.get("max_side"),
+    )
+
+
+def iter_video_frames(video_path: Path, max_frames: int = 120) -> Iterator[np.ndarray]:
+    """Yield up to ``max_frames`` decoded BGR frames at full rate and resolution."""
+    return iter(VideoFrameSource(video_path, max_frames))
+
+
+def read_video_frames(video_path: Path, max_frames: int = 120) -> List[np.ndarray]:
+    return list(iter_video_frames(video_path, max_frames))
+
+
+def tracker_from_config(detector: FaceDetector, config: dict) -> FaceTracker | None:
+    """FaceTracker from the ``detector.tracking`` config section; None when tracking is off."""
+    tracking = config.get("detector", {}).get("tracking") or {}
+    if not tracking.get("enabled", False):
+        return None
+    return FaceTracker(
+        detector,
+        redetect_interval=tracking.get("redetect_interval", 10),
+        min_confidence=tracking.get("min_confidence", 0.6),
+        search_margin=tracking.get("search_margin", 0.25),
+    )
+
+
+def iter_face_crops(
+    frames: Iterable[np.ndarray],
+    detector: FaceDetector,
+    size: Tuple[int, int] = (112, 112),
+    tracker: FaceTracker | None = None,
+    screen: Callable[[np.ndarray, FaceBox | None], bool] | None = None,
+) -> Iterator[np.ndarray]:
+    """Yield the face crop of every frame.
+
+    Without a tracker the box detected on the first frame is reused for all
+    frames; with one, each frame gets the tracker's box. Yields nothing if
+    there are no frames or no face on the first one.
+
+    ``screen(frame, None)`` is called on the first frame before detection and
+    ``screen(frame, face)`` once its face is found; returning False stops the
+    stream (see ``quality``).
+    """
+    if tracker is not None:
+        tracker.reset()
+    face = None
+    for i, frame in enumerate(frames):
+        if i == 0 and screen is not None and not screen(frame, None):
+            return
+        if tracker is not None:
+            face = tracker.update(frame)
+        elif face is None:
+            face = select_largest_face(detector.detect_faces(frame))
+        if face is None:
+            return
+        if i == 0 and screen is not None and not screen(frame, face):
+            return
+        yield crop_and_resize(frame, face, size)
+
+
+class VideoModuleStream:
+    """PAD module scores over a stream of face crops, computed on demand.
+
+    Texture and frequency only pull the first crop; motion or rPPG drain the
+    stream (feeding both accumulators in one pass). A cascade that stops after
+    the cheap modules therefore never decodes the rest of the video.
+    """
+
+    def __init__(
+        self, crops: Iterable[np.ndarray], pad: dict, fps: float | Callable[[], float] = DEFAULT_FPS, modules=PAD_MODULES
+    ):
+        self.pad = pad
+        # A callable is read once the stream is drained (e.g. the measured
+        # ``VideoFrameSource.sample_fps``).
+        self._fps = fps
+        self._crops = iter(crops)
+        self._first: np.ndarray | None = None
+        self._started = False
+        self._motion = None
+        if "motion" in modules:
+            self._motion = MotionAccumulator(pad["motion"]["mean_diff_low_threshold"], pad["motion"]["mean_diff_high_threshold"])
+        self._rppg = RppgAccumulator(DEFAULT_FPS if callable(fps) else fps) if "rppg" in modules else None
+
+    def _feed(self, crop: np.ndarray) -> None:
+        if self._motion is not None:
+            self._motion.update(crop)
+        if self._rppg is not None:
+            self._rppg.update(crop)
+
+    def first_crop(self) -> np.ndarray | None:
+        """First face crop; None if the stream is empty (no frames or no face)."""
+        if not self._started:
+            self._started = True
+            self._first = next(self._crops, None)
+            if self._first is not None:
+                self._feed(self._first)
+        return self._first
+
+    def _drain(self) -> None:
+        self.first_crop()
+        for crop in self._crops:
+            self._feed(crop)
+
+    def score(self, name: str) -> float:
+        pad = self.pad
+        if name == "texture":
+            return texture_score(self.first_crop(), pad["texture"]["lbp_points"], pad["texture"]["lbp_radius"])
+        if name == "freq":
+            return freq_score(self.first_crop(), pad["freq"]["high_freq_ratio_threshold"])
+        self._drain()
+        if name == "motion":
+            return self._motion.score()
+        if name == "rppg":
+            if callable(self._fps):
+                self._rppg.fps = self._fps()
+            return self._rppg.score()
+        raise ValueError(f"unknown PAD module: {name}")
+
+    def close(self) -> None:
+        """Stop decoding (releases the capture if the crops come from a generator)."""
+        close = getattr(self._crops, "close", None)
+        if close is not None:
+            close()
+
+
+def video_module_scores(
+    crops: Iterable[np.ndarray], pad: dict, modules=PAD_MODULES, fps: float | Callable[[], float] = DEFAULT_FPS
+) -> Dict[str, float] | None:
+    """Requested PAD module scores from a stream of face crops; None if the stream is empty.
+
+    ``pad`` is the ``pad`` section of the thresholds config and ``fps`` the
+    sampling rate of the crops (or a callable read after the stream ends). Texture and frequency use the first crop;
+    motion and rPPG accumulate over all of them.
+    """
+    stream = VideoModuleStream(crops, pad, fps, modules)
+    if stream.first_crop() is None:
+        return None
+    return {name: stream.score(name) for name in modules}